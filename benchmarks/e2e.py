@@ -0,0 +1,108 @@
+"""End-to-end benchmarks for the `scck` hot paths on a fake cluster.
+
+Every scenario runs the real `scck` command in a fresh interpreter with the
+stand-ins from `fake_cluster.py` first on PATH, so no Slurm or Lustre is
+needed. For each one the wall time, the throughput and the number of
+scheduler (or `lfs`) calls are reported.
+
+    python benchmarks/e2e.py [--jobs 10000 100000] [--tree 10 3 10] [--json FILE]
+"""
+import sys
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_cluster import FakeCluster
+
+SCCK = [sys.executable, "-c", "import sys; from scck.cli import run; sys.exit(run())"]
+
+def run_scck(cluster, argv, cwd = None, **env):
+    start = time.perf_counter()
+    proc = subprocess.run(SCCK + argv, env=cluster.env(**env), cwd=cwd,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"scck {' '.join(argv)} failed:\n{proc.stderr}")
+    return wall, cluster.calls()
+
+def scenarios(cluster, jobs, tree):
+    results = []
+
+    def record(name, wall, calls, items, unit):
+        results.append({
+            "scenario": name,
+            "wall_s": round(wall, 4),
+            "calls": len(calls),
+            "tools": sorted(set(call.split()[0] for call in calls)),
+            "items": items,
+            "rate": round(items / wall, 1) if wall > 0 else None,
+            "unit": unit,
+        })
+
+    cluster.write_config()
+    for num_jobs in jobs:
+        wall, calls = run_scck(cluster, ["-s", "-x", "11"], SCCK_FAKE_JOBS=num_jobs)
+        record(f"syhq {num_jobs} jobs (cold)", wall, calls, num_jobs, "jobs/s")
+        wall, calls = run_scck(cluster, ["-s", "-x", "11"], SCCK_FAKE_JOBS=num_jobs)
+        record(f"syhq {num_jobs} jobs (cached owners)", wall, calls, num_jobs, "jobs/s")
+        wall, calls = run_scck(cluster, ["queue", "-a", "-f", "json"], SCCK_FAKE_JOBS=num_jobs)
+        record(f"queue -a {num_jobs} jobs", wall, calls, num_jobs, "jobs/s")
+
+    width, depth, files = tree
+    num_files = cluster.make_tree("work", width=width, depth=depth, files=files)
+    cluster.make_tree("data", width=width, depth=max(depth - 1, 1), files=files, seed=1)
+    num_files += files * width ** max(depth - 1, 1)
+    for backend in ("posix", "lustre"):
+        config = json.loads((cluster.root / "cfg.json").read_text())
+        config["Config"]["dirstat_backend"] = backend
+        (cluster.root / "cfg.json").write_text(json.dumps(config))
+        shutil.rmtree(cluster.home / ".jobs", ignore_errors=True)
+        wall, calls = run_scck(cluster, ["-s", "-x", "12"])
+        record(f"dirstat {backend} (full)", wall, calls, num_files, "files/s")
+        wall, calls = run_scck(cluster, ["-s", "-x", "12"])
+        record(f"dirstat {backend} (incremental)", wall, calls, num_files, "files/s")
+
+    config = json.loads((cluster.root / "cfg.json").read_text())
+    config["Cluster"] = {}
+    (cluster.root / "cfg.json").write_text(json.dumps(config))
+    wall, calls = run_scck(cluster, ["refresh", "--quiet"])
+    record("refresh (cluster discovery)", wall, calls, 1, "runs/s")
+
+    cluster.write_config()
+    workdir = Path(tempfile.mkdtemp(dir=cluster.root))
+    wall, calls = run_scck(cluster, ["-s", "-x", "2 0 @ @ @ @ @ @ @ @"], cwd=workdir)
+    record("genjob (empty template)", wall, calls, 1, "runs/s")
+
+    return results
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, nargs="+", default=[10000, 100000], help="Queue sizes to benchmark.")
+    parser.add_argument("--tree", type=int, nargs=3, default=[10, 3, 10], metavar=("WIDTH", "DEPTH", "FILES"),
+                        help="Synthetic home tree: WIDTH**DEPTH leaf directories with FILES files each.")
+    parser.add_argument("--json", type=str, default=None, help="Also dump the results to this file.")
+    parser.add_argument("--keep", action="store_true", help="Keep the fake cluster directory.")
+    args = parser.parse_args()
+
+    cluster = FakeCluster()
+    try:
+        results = scenarios(cluster, args.jobs, args.tree)
+    finally:
+        if not args.keep:
+            shutil.rmtree(cluster.root, ignore_errors=True)
+
+    width = max(len(result["scenario"]) for result in results) + 2
+    print(f" {'Scenario':<{width}}{'Wall':>10}{'Calls':>8}{'Rate':>16}  Tools")
+    for result in results:
+        rate = f"{result['rate']:.0f} {result['unit']}"
+        print(f" {result['scenario']:<{width}}{result['wall_s']:>9.3f}s{result['calls']:>8}{rate:>16}  {','.join(result['tools'])}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=4))
+
+if __name__ == "__main__":
+    main()
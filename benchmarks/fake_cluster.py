@@ -0,0 +1,188 @@
+"""Stand-ins for the Slurm and Lustre tools `scck` shells out to.
+
+`FakeCluster` writes small Python executables named `squeue`, `scontrol`,
+`sinfo`, `sacctmgr` and `lfs` into a temporary `bin` directory. They emit a
+synthetic queue of any size and walk real directories for `lfs find`, and
+every invocation is appended to a log so scheduler calls can be counted.
+"""
+import os
+import sys
+import random
+import tempfile
+from pathlib import Path
+
+_COMMON = r'''#!{python}
+import os
+import sys
+with open(os.environ["SCCK_FAKE_LOG"], "a") as f:
+    f.write(" ".join([os.path.basename(sys.argv[0])] + sys.argv[1:]).replace("\n", " ") + "\n")
+NUM_JOBS = int(os.environ.get("SCCK_FAKE_JOBS", "100"))
+USERS = os.environ.get("SCCK_FAKE_USERS", "alice,bob").split(",")
+PARTITIONS = ["cpu", "gpu", "fat"]
+STATES = ["R", "R", "PD", "PD", "PD", "CF"]
+HOME = os.environ.get("HOME", "/home")
+
+def job(i):
+    user = USERS[i % len(USERS)]
+    return {{
+        "i": str(100000 + i),
+        "P": PARTITIONS[i % len(PARTITIONS)],
+        "j": f"calc,{{i}}" if i % 3 else f"{{user[:5].upper()}}-{{i}}",
+        "t": STATES[i % len(STATES)],
+        "M": "1:00:00",
+        "D": str(1 + i % 4),
+        "o": f"{{HOME}}/work/run{{i}}/job.sh",
+        "Z": f"{{HOME}}/work/run{{i}}",
+        "u": os.environ.get("USER", "root") if i % 2 else user,
+    }}
+'''
+
+_SQUEUE = r'''
+import re
+argv = sys.argv[1:]
+fmt = argv[argv.index("-o") + 1] if "-o" in argv else "%i %P %j %t %M %D"
+fields = re.split(r"(%[a-zA-Z])", fmt)
+out = []
+for i in range(NUM_JOBS):
+    values = job(i)
+    out.append("".join(values.get(part[1:], "") if part.startswith("%") else part for part in fields))
+sys.stdout.write("\n".join(out) + "\n")
+'''
+
+_SCONTROL = r'''
+argv = sys.argv[1:]
+if argv[:2] == ["show", "partition"]:
+    for name in PARTITIONS:
+        print(f"PartitionName={{name}}")
+        print(f"   AllowGroups=ALL AllowAccounts={{','.join(USERS)}},root AllowQos=normal,high")
+        print(f"   MaxTime=2-00:00:00 State=UP TotalCPUs=6400 TotalNodes=100")
+        print()
+elif argv[:2] == ["show", "job"]:
+    values = job(int(argv[2]) - 100000)
+    print(f"JobId={{values['i']}} JobName={{values['j']}}")
+    print(f"   Command={{values['o']}}")
+    print(f"   WorkDir={{values['Z']}}")
+'''
+
+_SINFO = r'''
+for name in PARTITIONS:
+    gres = "gpu:4" if name == "gpu" else "(null)"
+    print(f"{{name}} 100 64 {{gres}} 2-00:00:00 2:16:2")
+'''
+
+_SACCTMGR = r'''
+print("normal|10")
+print("high|100")
+'''
+
+_LFS = r'''
+argv = sys.argv[1:]
+if argv[0] != "find" or "--printf" not in argv:
+    sys.exit(1)
+root = argv[1]
+fmt = argv[argv.index("--printf") + 1].replace("\\n", "\n")
+
+def emit(path, kind, st):
+    values = {{"y": kind, "b": str(st.st_blocks), "s": str(st.st_size), "p": path,
+              "A@": repr(st.st_atime), "T@": repr(st.st_mtime)}}
+    out = fmt
+    for key in ("A@", "T@", "y", "b", "s", "p"):
+        out = out.replace("%" + key, values[key])
+    sys.stdout.write(out)
+
+emit(root, "d", os.lstat(root))
+for dirpath, dirnames, filenames in os.walk(root):
+    for name in dirnames:
+        path = os.path.join(dirpath, name)
+        emit(path, "d", os.lstat(path))
+    for name in filenames:
+        path = os.path.join(dirpath, name)
+        emit(path, "f", os.lstat(path))
+'''
+
+TOOLS = {
+    "squeue": _SQUEUE,
+    "scontrol": _SCONTROL,
+    "sinfo": _SINFO,
+    "sacctmgr": _SACCTMGR,
+    "lfs": _LFS,
+}
+
+class FakeCluster:
+    def __init__(self, root = None, num_jobs = 1000):
+        self.root = Path(root or tempfile.mkdtemp(prefix="scck-bench-"))
+        self.bin = self.root / "bin"
+        self.home = self.root / "home"
+        self.log = self.root / "calls.log"
+        self.num_jobs = num_jobs
+        self.bin.mkdir(parents=True, exist_ok=True)
+        self.home.mkdir(parents=True, exist_ok=True)
+        for name, body in TOOLS.items():
+            path = self.bin / name
+            path.write_text(_COMMON.format(python=sys.executable) + body.format())
+            path.chmod(0o755)
+
+    def env(self, **kwargs):
+        env = dict(os.environ)
+        # Commands run in other directories still import `scck` from this checkout.
+        repo = str(Path(__file__).resolve().parent.parent)
+        env.update({
+            "PATH": f"{self.bin}{os.pathsep}{env.get('PATH', '')}",
+            "PYTHONPATH": os.pathsep.join(filter(None, [repo, env.get("PYTHONPATH")])),
+            "HOME": str(self.home),
+            "USER": "root",
+            "XDG_CACHE_HOME": str(self.root / "cache"),
+            "XDG_CONFIG_HOME": str(self.root / "config"),
+            "SCCK_CONFIG": str(self.root / "cfg.json"),
+            "SCCK_USER_CONFIG": str(self.root / "user-cfg.json"),
+            "SCCK_FAKE_LOG": str(self.log),
+            "SCCK_FAKE_JOBS": str(self.num_jobs),
+        })
+        env.update({key: str(value) for key, value in kwargs.items()})
+        return env
+
+    def write_config(self, users = ("root",)):
+        """Write a cfg.json with the fake partitions, as if discovery had run."""
+        import json
+        import time
+        config = {
+            "Config": {"user_mode": "local", "job_log_dir": "~/.jobs", "cluster_updated": time.time()},
+            "Users": {
+                user: {"name": user, "short": [user[:5].upper()], "root": str(self.home), "info": "Fake User"}
+                for user in users
+            },
+            "Cluster": {
+                name: {"NODES": 100, "CPUS": 64, "GPUS": 4 if name == "gpu" else 0, "QOS": ["normal", "high"], "TIMELIMIT": "2-00:00:00",
+                       "SOCKETS": 2, "CORES": 16, "THREADS": 2}
+                for name in ("cpu", "gpu", "fat")
+            },
+            "Modules": {},
+        }
+        (self.root / "cfg.json").write_text(json.dumps(config, indent=4))
+        (self.root / "user-cfg.json").unlink(missing_ok=True)
+
+    def calls(self):
+        """Return and reset the logged tool invocations."""
+        try:
+            lines = self.log.read_text().splitlines()
+        except OSError:
+            lines = []
+        self.log.write_text("")
+        return lines
+
+    def make_tree(self, name, width = 10, depth = 3, files = 10, file_size = 4096, seed = 0):
+        """Create `~/name` with `width ** depth` leaf directories of `files` files each."""
+        rng = random.Random(seed)
+        root = self.home / name
+        total = 0
+        stack = [(root, 0)]
+        while stack:
+            path, level = stack.pop()
+            path.mkdir(parents=True, exist_ok=True)
+            if level == depth:
+                for i in range(files):
+                    (path / f"f{i}").write_bytes(b"x" * rng.randint(0, file_size))
+                    total += 1
+            else:
+                stack.extend((path / f"d{i}", level + 1) for i in range(width))
+        return total
@@ -0,0 +1,95 @@
+"""Startup latency budget for the `scck` entry points.
+
+`scck` runs inside every job script and `sub.sh`, so its cold start is paid
+thousands of times a day. Each entry point is started in a fresh interpreter
+with `-X importtime`; the wall time above a bare `python -c pass` is checked
+against a budget and the modules it must not import are checked as well.
+Every run uses its own HOME, config and cache under a temporary directory,
+seeded with the cfg.json of a fake cluster the user is already known to.
+
+    python benchmarks/startup.py [--repeat N] [--top N]
+
+Exits non-zero when a command is over budget or imports a forbidden module.
+"""
+import sys
+import time
+import shutil
+import statistics
+import subprocess
+from argparse import ArgumentParser
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_cluster import FakeCluster
+
+# Modules that only the commands which need them may import.
+HEAVY = ("multiprocessing", "subprocess", "difflib", "tqdm", "scck.basic.jobgen_template", "scck.config.auto")
+
+# (name, argv, budget in ms above the bare interpreter, forbidden modules)
+COMMANDS = [
+    ("job init", ["job", "init"], 60, HEAVY),
+    ("job user", ["job", "user"], 60, HEAVY),
+    ("cfg", ["cfg", "Config.job_log_dir"], 60, HEAVY),
+    ("-x 1", ["-s", "-x", "1"], 80, HEAVY),
+]
+
+def run_once(argv, env = None, importtime = False):
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ["-X", "importtime"]
+    cmd += argv
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return (time.perf_counter() - start) * 1000, proc.stderr
+
+def parse_importtime(stderr):
+    """Return `[(module, self_us, cumulative_us)]` from `-X importtime` output."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10, help="Runs per command; the median is reported.")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to show per command.")
+    args = parser.parse_args()
+
+    cluster = FakeCluster()
+    cluster.write_config()
+    env = cluster.env()
+    try:
+        baseline = statistics.median(run_once(["-c", "pass"], env)[0] for _ in range(args.repeat))
+        print(f" python -c pass: {baseline:.1f} ms")
+
+        failed = False
+        for name, argv, budget, forbidden in COMMANDS:
+            # The same as the `scck` console script generated for `scck.cli:run`.
+            argv = ["-c", "import sys; from scck.cli import run; sys.exit(run())"] + argv
+            wall = statistics.median(run_once(argv, env)[0] for _ in range(args.repeat)) - baseline
+            modules = parse_importtime(run_once(argv, env, importtime=True)[1])
+            imported = set(module for module, _, _ in modules)
+            leaked = [module for module in forbidden if module in imported]
+
+            status = "ok"
+            if wall > budget:
+                status = "OVER BUDGET"
+                failed = True
+            if leaked:
+                status = "FORBIDDEN IMPORTS"
+                failed = True
+            print(f" {name:<10}{wall:>8.1f} ms / {budget} ms  {len(modules):>4} modules  {status}")
+            for module in leaked:
+                print(f"     imports {module}")
+            for module, self_us, cumulative_us in sorted(modules, key=lambda x: x[1], reverse=True)[:args.top]:
+                print(f"     {self_us / 1000:>6.1f} ms  {module}")
+    finally:
+        shutil.rmtree(cluster.root, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,11 @@
-from .jobgen import run_genjob
+_exports = {
+    "run_genjob": ".jobgen",
+    "run_genjob_array": ".jobgen",
+}
+
+def __getattr__(name):
+    # Submodules are only imported on first use to keep `scck` startup cheap.
+    if name in _exports:
+        from importlib import import_module
+        return getattr(import_module(_exports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,54 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+from scck.config import CFG
+
+# Lines of params.ini that change the force fields. The scan and the tip
+# spring (`scanMin`, `klat`, `charge`, ...) only enter `ppafm-relaxed-scan`.
+FF_PARAMS = ("probeType", "tip", "sigma", "Rcore", "PBC", "gridA", "gridB", "gridC", "gridN")
+
+def get_ff_cache_dir():
+    """Return the cache directory, or `None` if `ppafm_ff_cache` is set to `false`."""
+    cache_dir = CFG['Config'].get('ppafm_ff_cache', True)
+    if cache_dir is False:
+        return None
+    if cache_dir is True or not cache_dir:
+        cache_dir = Path(os.getenv("XDG_CACHE_HOME") or "~/.cache") / "scck" / "ppafm-ff"
+    return Path(cache_dir).expanduser()
+
+def read_params(path = "params.ini"):
+    params = {}
+    for line in Path(path).read_text().splitlines():
+        fields = line.split("#")[0].split()
+        if len(fields) >= 2:
+            params[fields[0]] = " ".join(fields[1:])
+    return params
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ff_key(inputs, params_path = "params.ini", commands = ()):
+    """Hash the input files, the force-field lines of params.ini and the generating commands.
+
+    Missing inputs (e.g. an optional `atomtypes.ini`) are part of the key as well.
+    """
+    params = read_params(params_path)
+    key = {
+        "inputs": {Path(path).name: file_digest(path) if Path(path).is_file() else None for path in inputs},
+        "params": {name: params.get(name) for name in FF_PARAMS},
+        "commands": list(commands),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:32]
+
+def run_ffcache(args):
+    # Prints nothing when the cache is off, which the job script treats as a miss.
+    cache_dir = get_ff_cache_dir()
+    if cache_dir is None:
+        return
+    print(cache_dir / ff_key(args.inputs, args.params, args.command or ()))
@@ -1,15 +1,59 @@
+import os
 import sys
 from pathlib import Path
-from difflib import get_close_matches
 
 from scck.const import cmdlen
 from scck.fn import Prompt, parse_time, get_user_name
 from scck.config import CFG
-from scck.basic.jobgen_template import run_options
+from scck.profile import phase
+from scck.basic.jobgen_template import run_options, make_array_script, script_body
 
-def run_genjob(p: Prompt, *args, **kwargs):
+def render_tasks(p: Prompt, task_dirs, render):
+    """Render the job script in every task directory and return that of the first one.
+
+    Templates write their inputs next to the script, so each task needs its
+    own. The first task is rendered with `p`, the others replay its answers,
+    and they must all come out with the same script to share one array.
+    """
+    from io import StringIO
+    from contextlib import redirect_stdout
+    from scck.fn import BatchPrompt
+    cwd = os.getcwd()
+    try:
+        os.chdir(os.path.join(cwd, task_dirs[0]))
+        start = len(p.history)
+        sub_script, job_script = render(p)
+        answers = p.history[start:]
+        for task_dir in task_dirs[1:]:
+            os.chdir(os.path.join(cwd, task_dir))
+            with redirect_stdout(StringIO()):
+                _, task_script = render(BatchPrompt(answers))
+            if script_body(task_script) != script_body(job_script):
+                raise ValueError(f"The template renders a different script in {task_dir}; generate its job separately!")
+    finally:
+        os.chdir(cwd)
+    return sub_script, job_script
+
+def run_genjob(p: Prompt, *args, array = False, **kwargs):
     print(f" {' Job Generator '.center(cmdlen, '=')}")
 
+    if array:
+        # Asked first, since the template and the suggested resources depend
+        # on the inputs in the tasks and not in this directory.
+        task_glob = p.fill(
+            title = " Task directories of the array (glob, default: */)",
+            default = "*/",
+        )
+        task_dirs = sorted(str(d) for d in Path().glob(task_glob) if d.is_dir())
+        if len(task_dirs) == 0:
+            raise ValueError(f"No directory matches: {task_glob}!")
+        throttle = p.fill(
+            title = f" Max tasks running at once (default: all {len(task_dirs)})",
+            default = None,
+            mapper  = lambda x: int(x) if x is not None and x.isdigit() else None,
+            checker = lambda x: x is None or x >= 1,
+        )
+
     users = list(CFG["Users"].keys())
     if len(users) == 1:
         user = users[0]
@@ -34,6 +78,7 @@ def run_genjob(p: Prompt, *args, **kwargs):
         )]
     
     # Quality of service
+    from difflib import get_close_matches
     qoss = CFG["Cluster"][partition]["QOS"]
     
     if len(qoss) == 0:
@@ -52,6 +97,21 @@ def run_genjob(p: Prompt, *args, **kwargs):
             default_option = default_option,
         )]
 
+    # Suggested resources from past runs of the same template and input size
+    suggestion = None
+    if CFG['Config'].get('job_tune', True):
+        from scck.basic.jobtune import guess_template, input_size, load_history, suggest_resources
+        # An array is sized by its first task, like its `--comment` tag.
+        input_dir = Path(task_dirs[0]) if array else Path()
+        template = guess_template(input_dir)
+        if template is not None:
+            with phase("query"):
+                suggestion = suggest_resources(load_history(), template, input_size(template, input_dir), partition)
+        if suggestion is not None:
+            print(f" {suggestion['runs']} similar {template} runs found, the fewest node-hours were used by "
+                  f"{suggestion['nodes']} nodes x {suggestion['cpus_per_task']} CPUs per task "
+                  f"({suggestion['node_hours']:.2f} node-h per run, {suggestion['efficiency']:.0%} CPU efficiency).", file=p.out)
+
     # Time
     timelimit = CFG["Cluster"][partition]["TIMELIMIT"]
     timelimit = p.fill(
@@ -62,9 +122,10 @@ def run_genjob(p: Prompt, *args, **kwargs):
     )
     
     node = CFG['Cluster'][partition]['NODES']
+    default_node = suggestion['nodes'] if suggestion is not None and 1 <= suggestion['nodes'] <= node else 1
     node = p.fill(
-        title = f" Number of nodes: (1≤x≤{node})",
-        default = 1,
+        title = f" Number of nodes: (1≤x≤{node}, default: {default_node})",
+        default = default_node,
         mapper  = int,
         checker = lambda x: 1 <= x <= node,
     )
@@ -96,9 +157,13 @@ def run_genjob(p: Prompt, *args, **kwargs):
     if gpus_per_node is not None:
         cpus_per_task = cpus_per_node // gpus_per_node
     else:
+        default_cpus_per_task = None
+        if suggestion is not None and cpus_per_node % suggestion['cpus_per_task'] == 0:
+            default_cpus_per_task = str(suggestion['cpus_per_task'])
         cpus_per_task = p.fill(
-            title   = f" Number of CPUs per task: (*factor of {cpus_per_node})",
-            default = None,
+            title   = f" Number of CPUs per task: (*factor of {cpus_per_node})" if default_cpus_per_task is None
+                      else f" Number of CPUs per task: (*factor of {cpus_per_node}, default: {default_cpus_per_task})",
+            default = default_cpus_per_task,
             mapper  = lambda x: int(x) if x is not None and x.isdigit() else None,
             checker = lambda x: True if x is None else cpus_per_node % x == 0,
         )
@@ -111,7 +176,7 @@ def run_genjob(p: Prompt, *args, **kwargs):
     
     run_option = list(run_options.keys())[run_option]
     
-    sub_script, job_script = run_options[run_option](
+    render = lambda p: run_options[run_option](
         p = p, 
         partition = partition, 
         nodes = node, 
@@ -123,8 +188,21 @@ def run_genjob(p: Prompt, *args, **kwargs):
         *args, 
         **kwargs)
     
-    Path("sub.sh").write_text("\n".join(filter(lambda x: x is not None, sub_script)))
-    Path("job.sh").write_text("\n".join(filter(lambda x: x is not None, job_script)))
+    with phase("render"):
+        if array:
+            sub_script, job_script = render_tasks(p, task_dirs, render)
+            job_script = make_array_script(job_script, len(task_dirs), throttle)
+        else:
+            sub_script, job_script = render(p)
+
+    with phase("write"):
+        if array:
+            Path("tasks.txt").write_text("".join(d + "\n" for d in task_dirs))
+        Path("sub.sh").write_text("\n".join(filter(lambda x: x is not None, sub_script)))
+        Path("job.sh").write_text("\n".join(filter(lambda x: x is not None, job_script)))
 
     print(f"\n Success!")
     sys.exit()
+
+def run_genjob_array(p: Prompt, *args, **kwargs):
+    run_genjob(p, *args, array = True, **kwargs)
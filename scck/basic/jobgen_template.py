@@ -1,10 +1,40 @@
 import os
 import sys
-import subprocess
 from pathlib import Path
 
 from scck.fn import Prompt
 from scck.config import CFG
+from scck.basic.jobtune import job_comment
+
+def cpu_binding(partition, cpus_per_node, cpus_per_task):
+    """Return the `mpirun` mapping flags and the OpenMP pinning lines for this layout.
+
+    Ranks are spread evenly over the sockets recorded for the partition, each
+    bound to `cpus_per_task` cores (or hardware threads, when Slurm counts
+    them as CPUs), and OpenMP threads are kept close to their rank.
+    """
+    if not CFG["Config"].get("cpu_bind", True):
+        return "", []
+    cluster = CFG["Cluster"].get(partition, {})
+    cpus_per_task = cpus_per_task or 1
+    sockets = cluster.get("SOCKETS")
+    cores = cluster.get("CORES")
+    threads = cluster.get("THREADS")
+    hwthreads = bool(sockets and threads and threads > 1 and cluster.get("CPUS") == sockets * cores * threads)
+
+    flags = ["--use-hwthread-cpus"] if hwthreads else []
+    ranks_per_node = max(cpus_per_node // cpus_per_task, 1)
+    if sockets and ranks_per_node % sockets == 0 and ranks_per_node // sockets * cpus_per_task <= cores * (threads if hwthreads else 1):
+        flags.append(f"--map-by ppr:{ranks_per_node // sockets}:socket:PE={cpus_per_task}")
+    else:
+        flags.append(f"--map-by slot:PE={cpus_per_task}")
+    flags.append("--bind-to hwthread" if hwthreads else "--bind-to core")
+
+    omp = [
+        f"export OMP_PLACES={'threads' if hwthreads else 'cores'}",
+         "export OMP_PROC_BIND=close",
+    ]
+    return " " + " ".join(flags), omp
 
 def job_empty_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node, cpus_per_task, timelimit, qos, *args, **kwargs):
     if cpus_per_task is None:
@@ -13,6 +43,8 @@ def job_empty_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
     else:
         ntasks = nodes * cpus_per_node // cpus_per_task
         
+    mpi_binding, omp_binding = cpu_binding(partition, cpus_per_node, cpus_per_task)
+
     job_script = [
          "#!/bin/bash",
         f"#SBATCH --job-name=UNK-JOB",
@@ -23,6 +55,7 @@ def job_empty_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
         f"#SBATCH --gpus-per-node={gpus_per_node}" if gpus_per_node is not None else None,
         f"#SBATCH --time={timelimit}",
         f"#SBATCH --qos={qos}" if qos is not None else None,
+        f"#SBATCH --comment={job_comment('empty', cpus_per_task)}",
          "#SBATCH --output=slurm-%j.out",
          "#SBATCH --error=slurm-%j.err",
          "if [ -z \"${SLURM_JOB_ID}\" ]; then",
@@ -37,7 +70,8 @@ def job_empty_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
          "scck job init",
          "",
          "export OMP_NUM_THREADS=${SLURM_CPUS_PER_TASK}",
-         "mpirun -np $SLURM_NTASKS bash -c 'echo \"Rank ${OMPI_COMM_WORLD_RANK} on $(hostname)\"'"]
+        *omp_binding,
+        f"mpirun -np $SLURM_NTASKS{mpi_binding} bash -c 'echo \"Rank ${{OMPI_COMM_WORLD_RANK}} on $(hostname)\"'"]
 
     sub_script = [
         "JOB_NAME=`scck job user`",
@@ -86,6 +120,8 @@ def job_vasp_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node,
     
     src = vasp_cfg["src"]
     
+    mpi_binding, omp_binding = cpu_binding(partition, cpus_per_node, cpus_per_task)
+
     job_script = [
          "#!/bin/bash",
         f"#SBATCH --job-name=UNK-JOB",
@@ -96,6 +132,7 @@ def job_vasp_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node,
         f"#SBATCH --gpus-per-node={gpus_per_node}" if gpus_per_node is not None else None,
         f"#SBATCH --time={timelimit}",
         f"#SBATCH --qos={qos}" if qos is not None else None,
+        f"#SBATCH --comment={job_comment('vasp', cpus_per_task)}",
          "#SBATCH --output=slurm-%j.out",
          "#SBATCH --error=slurm-%j.err",
          "if [ -z \"${SLURM_JOB_ID}\" ]; then",
@@ -113,7 +150,8 @@ def job_vasp_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node,
          None if src is None else src,
          "ulimit -Ss unlimited",
          "export OMP_NUM_THREADS=${SLURM_CPUS_PER_TASK}",
-         "mpirun -np ${SLURM_NTASKS} vasp_std"]
+        *omp_binding,
+        f"mpirun -np ${{SLURM_NTASKS}}{mpi_binding} vasp_std"]
 
     sub_script = [
         "JOB_NAME=`scck job user`",
@@ -186,6 +224,8 @@ def job_lammps_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_nod
     
     src = lammps_cfg["src"]
     
+    mpi_binding, omp_binding = cpu_binding(partition, cpus_per_node, cpus_per_task)
+
     job_script = [
         "#!/bin/bash",
         f"#SBATCH --job-name=UNK-JOB",
@@ -196,6 +236,7 @@ def job_lammps_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_nod
         f"#SBATCH --gpus-per-node={gpus_per_node}" if gpus_per_node is not None else None,
         f"#SBATCH --time={timelimit}",
         f"#SBATCH --qos={qos}" if qos is not None else None,
+        f"#SBATCH --comment={job_comment('lammps', cpus_per_task)}",
         "#SBATCH --output=slurm-%j.out",
         "#SBATCH --error=slurm-%j.err",
         "if [ -z \"${SLURM_JOB_ID}\" ]; then",
@@ -212,7 +253,8 @@ def job_lammps_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_nod
         required,
         None if src is None else src,
         "export OMP_NUM_THREADS=${SLURM_CPUS_PER_TASK}",
-        f"mpirun -np ${{SLURM_NTASKS}} lmp {prefix} -in {in_files}"]
+        *omp_binding,
+        f"mpirun -np ${{SLURM_NTASKS}}{mpi_binding} lmp {prefix} -in {in_files}"]
 
     sub_script = [
         "JOB_NAME=`scck job user`",
@@ -273,44 +315,19 @@ def job_ppafm_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
     else:
         structure = structure_files[(p.select(
             title = " Select the structure file:",
-            options = list[map(lambda x: x.name, structure_files)],
+            options = list(map(lambda x: x.name, structure_files)),
             default_option = 0,
         ))]
     
     if structure.name == "LOCPOT":
-        import numpy as np
+        from ase.data import atomic_numbers
+        from scck.basic.locpot import read_locpot, write_xsf
         print(" LOCPOT detected, converting to XSF...")
-        try:
-            subprocess.run(["v2xsf", structure, "-d"], check = True, cwd = str(Path().cwd()))
-            structure = structure.with_suffix(".xsf")
-            print(f" Converted LOCPOT to XSF: {structure}")
-            flag = 0
-            with open("LOCPOT.xsf", "r") as f:
-                while flag < 2:
-                    line = f.readline()
-                    if line.startswith("PRIMVEC"):
-                        cell = f.readlines(3)
-                        cell = np.array(list(map(lambda x: list(map(float, x.strip().split())), cell)))
-                        flag += 1
-                        
-                    elif line.startswith("PRIMCOORD"):
-                        N, _ = f.readline().strip().split()
-                        lines = f.readlines(int(N))
-                        lines = list(map(lambda x: x.strip().split(), lines))
-                        numbers = []
-                        positions = []
-                        for line in lines:
-                            numbers.append(int(line[0]))
-                            positions.append(list(map(float, line[1:4])))
-                        
-                        atoms = Atoms(numbers, positions, cell = cell, pbc = [True, True, True])
-                        flag += 1
-            
-            write("in.xyz", atoms, format = "extxyz")
-            
-        except Exception as e:
-            print(f" Failed to convert LOCPOT to XSF.")
-            raise e
+        symbols, cell, positions, grid = read_locpot(structure)
+        atoms = Atoms(symbols, positions, cell = cell, pbc = [True, True, True])
+        write_xsf("LOCPOT.xsf", [atomic_numbers[s] for s in symbols], cell, positions, grid)
+        print(f" Converted LOCPOT to XSF: LOCPOT.xsf ({grid.shape[2]}x{grid.shape[1]}x{grid.shape[0]} grid)")
+        write("in.xyz", atoms, format = "extxyz")
         
     elif structure.suffix in [".xsf", ".poscar", ".xyz", ".cif"] or structure.name in ["CONTCAR", "POSCAR"]:
         print(f" Found structure file: {structure}")
@@ -340,6 +357,8 @@ def job_ppafm_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
     
     src = ppafm_cfg["src"]
     
+    _, omp_binding = cpu_binding(partition, cpus_per_node, cpus_per_task)
+
     job_script = [
         "#!/bin/bash",
         f"#SBATCH --job-name=UNK-JOB",
@@ -350,6 +369,7 @@ def job_ppafm_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
         f"#SBATCH --gpus-per-node={gpus_per_node}" if gpus_per_node is not None else None,
         f"#SBATCH --time={timelimit}",
         f"#SBATCH --qos={qos}" if qos is not None else None,
+        f"#SBATCH --comment={job_comment('ppafm', cpus_per_task)}",
         "#SBATCH --output=slurm-%j.out",
         "#SBATCH --error=slurm-%j.err",
         "if [ -z \"${SLURM_JOB_ID}\" ]; then",
@@ -365,17 +385,37 @@ def job_ppafm_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
         "",
         required,
         None if src is None else src,
-        "export OMP_NUM_THREADS=${SLURM_CPUS_PER_TASK}"]
-    
-    if structure.name == "LOCPOT":
-        job_script.append("ppafm-generate-elff -i LOCPOT.xsf -F xsf -t dz2 -f npy")
-    else:
-        job_script.append("ppafm-generate-elff-point-charges -i in.xyz -F xyz -t dz2 -f npy")
+        "export OMP_NUM_THREADS=${SLURM_CPUS_PER_TASK}",
+        *omp_binding]
     
     if structure.name == "LOCPOT":
-        job_script.append("ppafm-generate-ljff -i LOCPOT.xsf -F xsf -f npy")
+        ff_inputs = "LOCPOT.xsf atomtypes.ini"
+        ff_commands = ["ppafm-generate-elff -i LOCPOT.xsf -F xsf -t dz2 -f npy",
+                       "ppafm-generate-ljff -i LOCPOT.xsf -F xsf -f npy"]
     else:
-        job_script.append("ppafm-generate-ljff -i in.xyz -F xyz -f npy")
+        ff_inputs = "in.xyz atomtypes.ini"
+        ff_commands = ["ppafm-generate-elff-point-charges -i in.xyz -F xyz -t dz2 -f npy",
+                       "ppafm-generate-ljff -i in.xyz -F xyz -f npy"]
+    
+    # Force fields depend only on the structure, the grid and the tip, so a
+    # re-scan with other scan parameters copies them from the cache. The job
+    # computes the key itself since params.ini may be edited after generation,
+    # and does so before the ppafm environment may take `scck` off the PATH.
+    ff_key_command = " ".join(f"--command '{command}'" for command in ff_commands)
+    job_script.insert(job_script.index("scck job init") + 1, f"FF_CACHE=$(scck job ffcache {ff_inputs} {ff_key_command})")
+    job_script.extend([
+        "if [ -n \"${FF_CACHE}\" ] && [ -d \"${FF_CACHE}\" ]; then",
+        "    echo \"Using the force fields cached in ${FF_CACHE}\"",
+        "    cp \"${FF_CACHE}\"/FF* .",
+        "else",
+        *(f"    {command} || exit 1" for command in ff_commands),
+        "    if [ -n \"${FF_CACHE}\" ]; then",
+        "        # Fill a private directory and rename it, so concurrent jobs never see a partial entry.",
+        "        mkdir -p \"$(dirname \"${FF_CACHE}\")\"",
+        "        FF_TMP=$(mktemp -d \"${FF_CACHE}.XXXXXX\") && cp FF* \"${FF_TMP}\"/ && mv -T \"${FF_TMP}\" \"${FF_CACHE}\" 2>/dev/null || rm -rf \"${FF_TMP}\"",
+        "    fi",
+        "fi",
+    ])
     
     job_script.append("ppafm-relaxed-scan --pos -f npy")
     job_script.append("ppafm-plot-results --df --cbar -f npy")
@@ -390,6 +430,36 @@ def job_ppafm_template(p: Prompt, partition, nodes, cpus_per_node, gpus_per_node
     
     return sub_script, job_script
 
+def script_body(job_script):
+    """Return `job_script` without its `--comment` tag, which carries the input size of one task."""
+    return [line for line in job_script if not (line or "").startswith("#SBATCH --comment=")]
+
+def make_array_script(job_script, num_tasks, throttle = None, tasks_file = "tasks.txt"):
+    """Turn a single-job script from `run_options` into a job array over `num_tasks` directories.
+
+    Task `i` runs in the directory on line `i + 1` of `tasks_file`, and only
+    the first task records the logs of the whole array in the job index.
+    """
+    array = f"0-{num_tasks - 1}" + (f"%{throttle}" if throttle else "")
+    array_script = []
+    for line in job_script:
+        if line == "#SBATCH --output=slurm-%j.out":
+            array_script.append(f"#SBATCH --array={array}")
+            array_script.append("#SBATCH --output=slurm-%A_%a.out")
+        elif line == "#SBATCH --error=slurm-%j.err":
+            array_script.append("#SBATCH --error=slurm-%A_%a.err")
+        elif line == "scck job init":
+            array_script.extend([
+                "if [ \"${SLURM_ARRAY_TASK_ID}\" = \"${SLURM_ARRAY_TASK_MIN}\" ]; then",
+                "    scck job init --array ${SLURM_ARRAY_JOB_ID} --tasks ${SLURM_ARRAY_TASK_MIN}-${SLURM_ARRAY_TASK_MAX}:${SLURM_ARRAY_TASK_STEP:-1}",
+                "fi",
+               f"TASK_DIR=$(sed -n \"$((SLURM_ARRAY_TASK_ID + 1))p\" {tasks_file})",
+                "cd \"${TASK_DIR}\" || exit 1",
+            ])
+        else:
+            array_script.append(line)
+    return array_script
+
 run_options = {
     "empty": job_empty_template,
     "vasp": job_vasp_template,
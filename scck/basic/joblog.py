@@ -0,0 +1,253 @@
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+from scck.config import CFG
+from scck.profile import phase
+
+def parse_array_spec(spec: str):
+    """Expand a `sbatch --array` spec such as `0-9:2,15%4` into task ids."""
+    tasks = []
+    for part in spec.split("%")[0].split(","):
+        part = part.strip()
+        if not part:
+            continue
+        step = 1
+        if ":" in part:
+            part, step = part.split(":")
+            step = int(step)
+        if "-" in part:
+            start, end = part.split("-")
+            tasks.extend(range(int(start), int(end) + 1, step))
+        else:
+            tasks.append(int(part))
+    return tasks
+
+def find_job_stem(job_submit_dir: Path, env = os.environ):
+    """Return the `%A_%a` or `%j` part of the output file name of the running job.
+
+    Array tasks may be written with either pattern, so both are tried;
+    `None` is returned when no output file is found.
+    """
+    stems = []
+    if env.get('SLURM_ARRAY_JOB_ID') and env.get('SLURM_ARRAY_TASK_ID'):
+        stems.append(f"{env['SLURM_ARRAY_JOB_ID']}_{env['SLURM_ARRAY_TASK_ID']}")
+    if env.get('SLURM_JOB_ID'):
+        stems.append(env['SLURM_JOB_ID'])
+    for stem in stems:
+        if (job_submit_dir / f"slurm-{stem}.out").exists():
+            return stem
+    return None
+
+def find_array_stems(job_submit_dir: Path, array_job_id: str):
+    """Return the `%A_%a` stems of every array task output already in `job_submit_dir`."""
+    pattern = re.compile(rf"slurm-({re.escape(array_job_id)}_\d+)\.out")
+    stems = []
+    try:
+        with os.scandir(job_submit_dir) as it:
+            for entry in it:
+                match = pattern.fullmatch(entry.name)
+                if match:
+                    stems.append(match.group(1))
+    except OSError:
+        pass
+    return sorted(stems, key=lambda x: int(x.split("_")[1]))
+
+def _force_symlink(target, link):
+    try:
+        os.symlink(target, link)
+    except FileExistsError:
+        os.unlink(link)
+        os.symlink(target, link)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    user TEXT,
+    name TEXT,
+    started REAL,
+    submit_dir TEXT,
+    partition TEXT,
+    nodes INTEGER,
+    ntasks INTEGER,
+    cpus_per_task INTEGER,
+    node_list TEXT,
+    stdout TEXT,
+    stderr TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_user_started ON jobs (user, started);
+"""
+
+COLUMNS = ["job_id", "user", "name", "started", "submit_dir", "partition", "nodes", "ntasks", "cpus_per_task", "node_list", "stdout", "stderr"]
+
+def get_index_path():
+    return Path(CFG['Config'].get('job_index') or Path(CFG['Config']['job_log_dir']) / "jobs.sqlite").expanduser()
+
+def connect_index():
+    import sqlite3
+    path = get_index_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Many tasks of an array may start at once; writers wait for the lock
+    # instead of failing. WAL is avoided as it does not work on Lustre/NFS.
+    db = sqlite3.connect(str(path), timeout=60)
+    db.executescript(SCHEMA)
+    return db
+
+def _int_env(env, name):
+    try:
+        return int(env[name])
+    except (KeyError, ValueError):
+        return None
+
+def _started(path, default):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return default
+
+def record_jobs(job_submit_dir: Path, stems, user_name: str, submit_links = True, env = os.environ, now = None):
+    """Record `slurm-<stem>.out/.err` of every job in `stems` in the job index.
+
+    Only the stem of the calling job gets its name, resources and start time
+    from the Slurm environment; other jobs, e.g. the rest of an array
+    recorded from its first task, are left with NULL ones. They are started
+    at the mtime of their output when it exists, or else when they were
+    recorded, so that searches by time and pruning still find them. With
+    `submit_links`, `slurm.out` and `slurm.err` in `job_submit_dir` point to
+    the last job.
+    """
+    import time
+    now = time.time() if now is None else now
+    job_submit_dir = os.path.realpath(job_submit_dir)
+    current = {env.get('SLURM_JOB_ID')}
+    if env.get('SLURM_ARRAY_JOB_ID') and env.get('SLURM_ARRAY_TASK_ID'):
+        current.add(f"{env['SLURM_ARRAY_JOB_ID']}_{env['SLURM_ARRAY_TASK_ID']}")
+    current.discard(None)
+
+    rows = []
+    for stem in stems:
+        stdout = os.path.join(job_submit_dir, f"slurm-{stem}.out")
+        stderr = os.path.join(job_submit_dir, f"slurm-{stem}.err")
+        if stem in current:
+            rows.append((
+                stem,
+                user_name,
+                env.get('SLURM_JOB_NAME'),
+                now,
+                job_submit_dir,
+                env.get('SLURM_JOB_PARTITION'),
+                _int_env(env, 'SLURM_JOB_NUM_NODES'),
+                _int_env(env, 'SLURM_NTASKS'),
+                _int_env(env, 'SLURM_CPUS_PER_TASK'),
+                env.get('SLURM_JOB_NODELIST'),
+                stdout,
+                stderr,
+            ))
+        else:
+            rows.append((stem, user_name, None, _started(stdout, now), job_submit_dir, None, None, None, None, None, stdout, stderr))
+
+    with phase("write"):
+        db = connect_index()
+        with db:
+            db.executemany(f"INSERT OR REPLACE INTO jobs VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+        db.close()
+        if submit_links and stems:
+            for ext in ("out", "err"):
+                _force_symlink(os.path.join(job_submit_dir, f"slurm-{stems[-1]}.{ext}"), os.path.join(job_submit_dir, f"slurm.{ext}"))
+    return len(rows)
+
+def parse_since(value: str, now = None):
+    """Turn `7d`, `12h`, `2w` or a `YYYY-MM-DD[ HH:MM]` date into a timestamp."""
+    import time
+    now = time.time() if now is None else now
+    units = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([mhdw])", value.strip())
+    if match:
+        return now - float(match.group(1)) * units[match.group(2)]
+    return datetime.fromisoformat(value.strip()).timestamp()
+
+def query_jobs(job_ids):
+    db = connect_index()
+    rows = []
+    for job_id in job_ids:
+        # An array job id matches all of its tasks.
+        rows.extend(db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE job_id = ? OR job_id GLOB ? ORDER BY started",
+            (job_id, f"{job_id}_[0-9]*"),
+        ))
+    db.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+def search_jobs(user = None, since = None, until = None, name = None, submit_dir = None, partition = None, limit = None):
+    """Return the indexed jobs matching every given filter, newest first.
+
+    `name` and `submit_dir` are glob patterns.
+    """
+    where = []
+    params = []
+    for column, op, value in (
+        ("user", "=", user),
+        ("started", ">=", since),
+        ("started", "<", until),
+        ("name", "GLOB", name),
+        ("submit_dir", "GLOB", submit_dir),
+        ("partition", "=", partition),
+    ):
+        if value is not None:
+            where.append(f"{column} {op} ?")
+            params.append(value)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY started DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    db = connect_index()
+    rows = db.execute(sql, params).fetchall()
+    db.close()
+    return [dict(zip(COLUMNS, row)) for row in rows]
+
+def prune_jobs(before = None, missing = False):
+    """Delete jobs started before `before` and, with `missing`, jobs whose output is gone."""
+    db = connect_index()
+    removed = 0
+    with db:
+        if before is not None:
+            removed += db.execute("DELETE FROM jobs WHERE started < ?", (before,)).rowcount
+        if missing:
+            gone = [(job_id,) for job_id, stdout in db.execute("SELECT job_id, stdout FROM jobs") if not os.path.exists(stdout)]
+            db.executemany("DELETE FROM jobs WHERE job_id = ?", gone)
+            removed += len(gone)
+    db.execute("VACUUM")
+    db.close()
+    return removed
+
+def dump_jobs(rows, fmt = "table", out = None):
+    import sys
+    import json
+    out = out or sys.stdout
+    if fmt == "json":
+        json.dump(rows, out, indent=4, ensure_ascii=False)
+        out.write("\n")
+    elif fmt == "csv":
+        import csv
+        writer = csv.DictWriter(out, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        from scck.const import cmdlen
+        home = str(Path.home())
+        id_width = max([len(row["job_id"]) for row in rows] + [6]) + 2
+        part_width = max([len(row["partition"] or "") for row in rows] + [9]) + 2
+        out.write(" " + " JOBS ".center(cmdlen, "=") + "\n")
+        out.write(" " + f"{'Job ID'.ljust(id_width)}{'Started'.ljust(18)}{'Partition'.ljust(part_width)}{'Nodes'.rjust(6)}  Directory" + "\n")
+        out.write(" " + "-" * cmdlen + "\n")
+        for row in rows:
+            started = "" if row["started"] is None else datetime.fromtimestamp(row["started"]).strftime("%Y-%m-%d %H:%M")
+            nodes = "" if row["nodes"] is None else str(row["nodes"])
+            out.write(" " + f"{row['job_id'].ljust(id_width)}{started.ljust(18)}{(row['partition'] or '').ljust(part_width)}{nodes.rjust(6)}  {row['submit_dir'].replace(home, '~')}" + "\n")
+        out.write(" " + "-" * cmdlen + "\n")
+        out.write(f" Jobs: {len(rows)}" + "\n")
+    out.flush()
@@ -0,0 +1,125 @@
+import sys
+from pathlib import Path
+from statistics import median
+
+from scck.fn import parse_seconds
+from scck.config import CFG
+
+# Jobs written by the generator carry `--comment=scck:<template>:<size>:<cpus per task>`
+# so that their accounting records can be matched to new jobs of the same kind.
+# Slurm only keeps job comments in accounting with `AccountingStoreFlags=job_comment`
+# in slurm.conf, which is off by default; without it there is no history.
+COMMENT_PREFIX = "scck"
+
+def count_poscar_atoms(path):
+    lines = Path(path).read_text().splitlines()
+    # VASP 5 has a line of element symbols before the counts, VASP 4 does not.
+    counts = lines[5].split()
+    if not counts[0].isdigit():
+        counts = lines[6].split()
+    return sum(int(x) for x in counts)
+
+def count_lammps_atoms(path):
+    data_file = None
+    for line in Path(path).read_text().splitlines():
+        fields = line.split("#")[0].split()
+        if len(fields) >= 2 and fields[0] == "read_data":
+            data_file = Path(path).parent / fields[1]
+            break
+    if data_file is None:
+        return 0
+    with open(data_file) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2 and fields[1] == "atoms":
+                return int(fields[0])
+    return 0
+
+def input_size(template, cwd = Path()):
+    """Return the size of the input of `template` in `cwd` (atoms for VASP and LAMMPS), or 0 if unknown."""
+    try:
+        if template == "vasp":
+            return count_poscar_atoms(cwd / "POSCAR")
+        if template == "lammps":
+            for path in sorted(cwd.glob("*")):
+                if path.is_file() and path.stem in ("in", "input"):
+                    return count_lammps_atoms(path)
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+def guess_template(cwd = Path()):
+    """Guess which template the inputs in `cwd` are for, before it is selected."""
+    if (cwd / "INCAR").exists() or (cwd / "POSCAR").exists():
+        return "vasp"
+    if any(path.stem in ("in", "input") for path in cwd.glob("*") if path.is_file()):
+        return "lammps"
+    return None
+
+def job_comment(template, cpus_per_task, cwd = Path()):
+    return f"{COMMENT_PREFIX}:{template}:{input_size(template, cwd)}:{cpus_per_task or 1}"
+
+def load_history(days = None):
+    """Return `(template, size, cpus_per_task, partition, nodes, elapsed_s, cpu_efficiency)` of completed scck jobs."""
+    import subprocess
+    days = int(days or CFG['Config'].get('job_tune_days', 90))
+    try:
+        result = subprocess.run(
+            ["sacct", "-X", "-n", "-P", "-s", "CD", "-S", f"now-{days}days",
+             "--format=Comment,Partition,NNodes,NCPUS,Elapsed,TotalCPU"],
+            capture_output=True, text=True, check=True, timeout=30,
+        ).stdout
+    except (FileNotFoundError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return []
+
+    lines = [line for line in result.splitlines() if line.strip()]
+    if lines and not any(line.split("|")[0] for line in lines):
+        print(" No completed job has a comment in Slurm accounting, so no resources can be suggested: "
+              "this needs `AccountingStoreFlags=job_comment` in slurm.conf (or set `job_tune` to false).", file=sys.stderr)
+        return []
+
+    history = []
+    for line in lines:
+        fields = line.split("|")
+        if len(fields) != 6 or not fields[0].startswith(COMMENT_PREFIX + ":"):
+            continue
+        try:
+            _, template, size, cpus_per_task = fields[0].split(":")
+            elapsed = parse_seconds(fields[4])
+            cpu_time = parse_seconds(fields[5])
+            ncpus = int(fields[3])
+            history.append((
+                template, int(size), int(cpus_per_task), fields[1], int(fields[2]), elapsed,
+                cpu_time / (elapsed * ncpus) if elapsed > 0 and ncpus > 0 else 0.0,
+            ))
+        except ValueError:
+            continue
+    return history
+
+def suggest_resources(history, template, size, partition, tolerance = 0.1):
+    """Pick the nodes and CPUs per task that used the fewest node-hours per run.
+
+    Only runs of the same template on the same partition whose input size is
+    within `tolerance` of `size` are compared; the median of each
+    (nodes, CPUs per task) pair is used. Returns `None` without history.
+    """
+    groups = {}
+    for h_template, h_size, cpus_per_task, h_partition, nodes, elapsed, efficiency in history:
+        if h_template != template or h_partition != partition or elapsed <= 0:
+            continue
+        if abs(h_size - size) > tolerance * max(size, 1):
+            continue
+        groups.setdefault((nodes, cpus_per_task), []).append((elapsed * nodes / 3600, efficiency))
+    if not groups:
+        return None
+
+    scores = {key: median(node_hours for node_hours, _ in runs) for key, runs in groups.items()}
+    nodes, cpus_per_task = min(scores, key=scores.get)
+    runs = groups[(nodes, cpus_per_task)]
+    return {
+        "nodes": nodes,
+        "cpus_per_task": cpus_per_task,
+        "node_hours": scores[(nodes, cpus_per_task)],
+        "efficiency": median(efficiency for _, efficiency in runs),
+        "runs": sum(len(runs) for runs in groups.values()),
+    }
@@ -0,0 +1,59 @@
+import numpy as np
+
+def read_locpot(path):
+    """Read a VASP 5 LOCPOT (or CHGCAR) file.
+
+    Returns `(symbols, cell, positions, grid)` where `positions` are
+    Cartesian in Å and `grid` is indexed `[z, y, x]` as VASP writes it.
+    Only the first volumetric block is read; its values are parsed in C by
+    `np.fromfile` straight from the file.
+    """
+    with open(path, "rb") as f:
+        f.readline()
+        scale = float(f.readline().split()[0])
+        cell = np.array([f.readline().split()[:3] for _ in range(3)], dtype=float)
+        symbols = f.readline().split()
+        if symbols[0].isdigit():
+            raise ValueError(f"{path} has no element symbols (VASP 4 format)!")
+        symbols = [symbol.decode().split("/")[0].split("_")[0] for symbol in symbols]
+        counts = [int(x) for x in f.readline().split()]
+        mode = f.readline().strip()
+        if mode[:1] in (b"S", b"s"):
+            mode = f.readline().strip()
+        num_atoms = sum(counts)
+        positions = np.array([f.readline().split()[:3] for _ in range(num_atoms)], dtype=float)
+
+        line = f.readline()
+        while line and not line.strip():
+            line = f.readline()
+        nx, ny, nz = (int(x) for x in line.split())
+        grid = np.fromfile(f, dtype=float, count=nx * ny * nz, sep=" ")
+        if grid.size != nx * ny * nz:
+            raise ValueError(f"{path} is truncated: {grid.size} of {nx * ny * nz} grid values!")
+
+    if scale < 0:
+        # A negative scale is the cell volume.
+        scale = (-scale / abs(np.linalg.det(cell))) ** (1 / 3)
+    cell *= scale
+    if mode[:1] in (b"C", b"c", b"K", b"k"):
+        positions *= scale
+    else:
+        positions = positions @ cell
+    symbols = [symbol for symbol, count in zip(symbols, counts) for _ in range(count)]
+    return symbols, cell, positions, grid.reshape(nz, ny, nx)
+
+def write_xsf(path, numbers, cell, positions, grid, name = "LOCPOT"):
+    """Write a periodic XSF with the structure and `grid` (indexed `[z, y, x]`) as a general 3D datagrid."""
+    # XSF grids include the periodic image on the far faces.
+    grid = np.pad(grid, ((0, 1), (0, 1), (0, 1)), mode="wrap")
+    nz, ny, nx = grid.shape
+    vectors = "\n".join(f" {a:.10f} {b:.10f} {c:.10f}" for a, b, c in cell)
+    with open(path, "w") as f:
+        f.write("CRYSTAL\nPRIMVEC\n" + vectors + "\n")
+        f.write(f"PRIMCOORD\n {len(numbers)} 1\n")
+        f.write("".join(f" {z:d} {x:.10f} {y:.10f} {w:.10f}\n" for z, (x, y, w) in zip(numbers, positions)))
+        f.write(f"BEGIN_BLOCK_DATAGRID_3D\n {name}\n BEGIN_DATAGRID_3D_{name}\n")
+        f.write(f" {nx} {ny} {nz}\n 0.0 0.0 0.0\n" + vectors + "\n")
+        f.flush()
+        grid.tofile(f, sep="\n", format="%.6e")
+        f.write("\n END_DATAGRID_3D\nEND_BLOCK_DATAGRID_3D\n")
@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import shutil
+import itertools
+from pathlib import Path
+
+from scck.const import cmdlen
+from scck.fn import BatchPrompt, parse_seconds, format_seconds
+from scck.config import CFG
+from scck.profile import phase
+
+RESOURCES = ("partition", "qos", "nodes", "timelimit", "gpus_per_node", "cpus_per_node", "cpus_per_task")
+
+def load_spec(path):
+    if sys.version_info >= (3, 11):
+        import tomllib
+    else:
+        import tomli as tomllib
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+def expand_sweep(spec):
+    """Return one dict of values per point of the Cartesian product of `[sweep]` over `[defaults]`."""
+    defaults = spec.get("defaults", {})
+    sweep = spec.get("sweep", {})
+    keys = list(sweep.keys())
+    values = [value if isinstance(value, list) else [value] for value in sweep.values()]
+    return [{**defaults, **dict(zip(keys, combo))} for combo in itertools.product(*values)]
+
+def point_dir_name(spec, point):
+    fmt = spec.get("name")
+    if fmt is None:
+        name = "-".join(f"{key}{point[key]}" for key in spec.get("sweep", {})) or "job"
+    else:
+        name = fmt.format(**point)
+    return re.sub(r"[^\w.+-]", "_", name)
+
+def resolve_resources(partition = None, qos = None, nodes = None, timelimit = None, gpus_per_node = None, cpus_per_node = None, cpus_per_task = None, **kwargs):
+    """Fill in unset resources with the defaults `run_genjob` offers, and check them against the partition."""
+    if partition is None:
+        partition = list(CFG["Cluster"].keys())[0]
+    cluster = CFG["Cluster"][partition]
+
+    if qos is None and len(cluster["QOS"]) > 0:
+        from difflib import get_close_matches
+        qos = (get_close_matches("normal", cluster["QOS"], n=1) or cluster["QOS"])[0]
+    elif qos is not None and qos not in cluster["QOS"]:
+        raise ValueError(f"Invalid qos for {partition}: {qos}!")
+
+    try:
+        max_time = parse_seconds(cluster["TIMELIMIT"])
+    except ValueError:
+        # `infinite` or `UNLIMITED`
+        max_time = None
+    if timelimit is None:
+        if max_time is None:
+            raise ValueError(f"No time limit given and {partition} has none!")
+        timelimit = max_time
+    else:
+        timelimit = parse_seconds(timelimit)
+        if max_time is not None and timelimit > max_time:
+            raise ValueError(f"Time limit over the maximum of {partition}: {format_seconds(timelimit)}!")
+
+    nodes = int(nodes or 1)
+    if not 1 <= nodes <= cluster["NODES"]:
+        raise ValueError(f"Invalid number of nodes for {partition}: {nodes}!")
+
+    max_gpu = int(cluster["GPUS"] or 0)
+    max_cpu = cluster["CPUS"]
+    if max_gpu > 0:
+        gpus_per_node = int(gpus_per_node or 1)
+        if not 1 <= gpus_per_node <= max_gpu:
+            raise ValueError(f"Invalid number of GPUs per node for {partition}: {gpus_per_node}!")
+        cpus_per_node = max_cpu * gpus_per_node // max_gpu
+        cpus_per_task = cpus_per_node // gpus_per_node
+    else:
+        gpus_per_node = None
+        cpus_per_node = int(cpus_per_node or max_cpu) if nodes == 1 else max_cpu
+        if not 1 <= cpus_per_node <= max_cpu:
+            raise ValueError(f"Invalid number of CPUs per node for {partition}: {cpus_per_node}!")
+        if cpus_per_task is not None:
+            cpus_per_task = int(cpus_per_task)
+            if cpus_per_node % cpus_per_task != 0:
+                raise ValueError(f"CPUs per task is not a factor of {cpus_per_node}: {cpus_per_task}!")
+
+    return {
+        "partition": partition,
+        "qos": qos,
+        "nodes": nodes,
+        "timelimit": format_seconds(timelimit),
+        "gpus_per_node": gpus_per_node,
+        "cpus_per_node": cpus_per_node,
+        "cpus_per_task": cpus_per_task,
+    }
+
+def _write_point(task):
+    # Runs in a worker process: templates read and write the current
+    # directory, so every point is rendered after a `chdir` into its own.
+    from io import StringIO
+    from string import Template
+    from contextlib import redirect_stdout
+    from scck.basic.jobgen_template import run_options
+
+    spec, base_dir, job_dir, point, resources, write_scripts = task
+    job_dir.mkdir(parents=True, exist_ok=True)
+    variables = {key: str(value) for key, value in point.items()}
+    for name in spec.get("inputs", []):
+        shutil.copy2(base_dir / name, job_dir / Path(name).name)
+    for name in spec.get("links", []):
+        link = job_dir / Path(name).name
+        if not os.path.lexists(link):
+            os.symlink((base_dir / name).resolve(), link)
+    for name in spec.get("templates", []):
+        text = (base_dir / name).read_text()
+        (job_dir / Path(name).name).write_text(Template(text).safe_substitute(variables))
+
+    os.chdir(job_dir)
+    extra = {key: value for key, value in point.items() if key not in RESOURCES}
+    p = BatchPrompt(spec.get("answers"))
+    with redirect_stdout(StringIO()):
+        sub_script, job_script = run_options[spec.get("template", "empty")](p = p, **resources, **extra)
+    if write_scripts:
+        Path("sub.sh").write_text("\n".join(filter(lambda x: x is not None, sub_script)))
+        Path("job.sh").write_text("\n".join(filter(lambda x: x is not None, job_script)))
+    return str(job_dir), sub_script, job_script
+
+def write_sweep(spec, base_dir: Path, out_dir: Path, workers = None, array = False, throttle = None):
+    """Render every point of the sweep into its own directory under `out_dir`.
+
+    Resources of all points are checked before anything is written. With
+    `array`, the points become the tasks of a single job array whose
+    `job.sh` and `tasks.txt` are written to `out_dir` instead.
+    """
+    from scck.basic.jobgen_template import run_options, make_array_script, script_body
+    if spec.get("template", "empty") not in run_options:
+        raise ValueError(f"Unknown template: {spec.get('template')}!")
+    tasks = []
+    seen = set()
+    for point in expand_sweep(spec):
+        job_dir = (out_dir / point_dir_name(spec, point)).resolve()
+        if job_dir in seen:
+            raise ValueError(f"Two points of the sweep map to the same directory: {job_dir.name}!")
+        seen.add(job_dir)
+        resources = resolve_resources(**{key: point[key] for key in RESOURCES if key in point})
+        tasks.append((spec, base_dir.resolve(), job_dir, point, resources, not array))
+    if array and any(task[4] != tasks[0][4] for task in tasks):
+        raise ValueError("Tasks of a job array share their resources; do not sweep them with --array!")
+
+    workers = min(int(workers or os.cpu_count() or 1), len(tasks))
+    if workers <= 1:
+        cwd = os.getcwd()
+        try:
+            results = [_write_point(task) for task in tasks]
+        finally:
+            os.chdir(cwd)
+    else:
+        import multiprocessing
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_write_point, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+    if not array:
+        return [job_dir for job_dir, _, _ in results]
+
+    # Every point was rendered in its own directory, so the `--comment` tag
+    # of the first one carries the input size of a real task; it may differ
+    # between tasks and is left out of the comparison.
+    _, sub_script, job_script = results[0]
+    if any(script_body(result[2]) != script_body(job_script) for result in results):
+        raise ValueError("The template renders a different script for some points; run the sweep without --array!")
+    out_dir = out_dir.resolve()
+    (out_dir / "tasks.txt").write_text("".join(os.path.relpath(job_dir, out_dir) + "\n" for job_dir, _, _ in results))
+    (out_dir / "sub.sh").write_text("\n".join(filter(lambda x: x is not None, sub_script)))
+    job_script = make_array_script(job_script, len(results), throttle)
+    (out_dir / "job.sh").write_text("\n".join(filter(lambda x: x is not None, job_script)))
+    return [str(out_dir)]
+
+def submit_sweep(job_dirs):
+    """`sbatch` every directory one after another and return `{dir: job id}`."""
+    import subprocess
+    from scck.fn import get_user_name
+    # What `sub.sh` does, without starting `scck job user` once per directory.
+    user = get_user_name()
+    job_name = CFG['Users'][user]['short'][0] if user in CFG['Users'] else user
+    job_ids = {}
+    for job_dir in job_dirs:
+        result = subprocess.run(
+            ["sbatch", "--parsable", f"--job-name={job_name}", "job.sh"],
+            cwd=job_dir, capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            print(f" Failed to submit {job_dir}: {result.stderr.strip()}", file=sys.stderr)
+            continue
+        job_ids[job_dir] = result.stdout.strip().split(";")[0]
+    return job_ids
+
+def run_sweep(args):
+    print(f" {' Job Sweep '.center(cmdlen, '=')}")
+    spec_path = Path(args.spec)
+    spec = load_spec(spec_path)
+    out_dir = Path(args.out) if args.out else spec_path.parent
+
+    if args.dry_run:
+        for point in expand_sweep(spec):
+            resolve_resources(**{key: point[key] for key in RESOURCES if key in point})
+            print(f" {out_dir / point_dir_name(spec, point)}")
+        sys.exit(0)
+
+    with phase("write"):
+        job_dirs = write_sweep(
+            spec, spec_path.parent, out_dir,
+            workers = args.workers,
+            array = args.array or spec.get("array", False),
+            throttle = args.throttle or spec.get("throttle"),
+        )
+    if args.array or spec.get("array", False):
+        print(f" Generated a job array of {len(expand_sweep(spec))} tasks in {out_dir}.")
+    else:
+        print(f" Generated {len(job_dirs)} job directories under {out_dir}.")
+
+    if args.submit:
+        with phase("query"):
+            job_ids = submit_sweep(job_dirs)
+        for job_dir, job_id in job_ids.items():
+            print(f" {job_id:>10}  {job_dir}")
+        print(f" Submitted {len(job_ids)}/{len(job_dirs)} jobs.")
+        if len(job_ids) != len(job_dirs):
+            sys.exit(1)
+    sys.exit(0)
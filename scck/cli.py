@@ -1,20 +1,31 @@
 from scck.const import title, cmdlen
 
+def lazy_call(target):
+    # Commands are imported only when selected, so that startup does not pay
+    # for multiprocessing, subprocess or the job templates.
+    def call(*args, **kwargs):
+        from importlib import import_module
+        module, name = target.split(":")
+        return getattr(import_module(module), name)(*args, **kwargs)
+    return call
+
 def run_main(args):
     import sys
     from scck.fn import Prompt
     from scck.error import BackException
-    from scck.basic import run_genjob
-    from scck.info import run_slurm_table_generator, run_dirstat
     
     callbacks = {
         "Basic": [
             (1, "Print Hello World", lambda p: print("Hello, World!")),
-            (2, "Generate jobs script on cluster", run_genjob),
+            (2, "Generate jobs script on cluster", lazy_call("scck.basic.jobgen:run_genjob")),
+            (3, "Generate job array script on cluster", lazy_call("scck.basic.jobgen:run_genjob_array")),
         ],
         "Info": [
-            (11, "Slurm jobs statistics", run_slurm_table_generator),
-            (12, "Directory statistics", run_dirstat),
+            (11, "Slurm jobs statistics", lazy_call("scck.info.syhq:run_slurm_table_generator")),
+            (12, "Directory statistics", lazy_call("scck.info.dirstat:run_dirstat")),
+            (13, "Slurm jobs statistics (live)", lazy_call("scck.info.syhq:run_slurm_table_watch")),
+            (14, "Directory cleanup report", lazy_call("scck.info.dirstat_report:run_dirstat_report")),
+            (15, "Directory growth history", lazy_call("scck.info.dirstat_history:run_dirstat_history")),
         ],
     }
 
@@ -81,35 +92,60 @@ def run_cfg(args):
     
 def run_job_init(args):
     import os
-    from datetime import datetime
     from pathlib import Path
     from scck.fn import get_user_name
-    from scck.config import CFG
-    date = datetime.now().strftime("%Y%m%d")
-    name = get_user_name()
-    job_submit_dir = Path(os.getenv('SLURM_SUBMIT_DIR', "UNK-DIR")).expanduser()
-    job_id = os.getenv('SLURM_JOB_ID', "UNK-ID")
-    if not (job_submit_dir / f"slurm-{job_id}.out").exists():
-        return
-    
-    job_log_dir = Path(CFG['Config']['job_log_dir']).expanduser() / name
-    job_log_dir.mkdir(parents=True, exist_ok=True)
-    
-    save_name = f"{date}-{job_id}"
-    
-    if (job_submit_dir / f"slurm.out").exists():
-        (job_submit_dir / f"slurm.out").unlink()
-    if (job_submit_dir / f"slurm.err").exists():
-        (job_submit_dir / f"slurm.err").unlink()
-    if (job_log_dir / f"{save_name}.{job_id}.out").exists():
-        (job_log_dir / f"{save_name}.{job_id}.out").unlink()
-    if (job_log_dir / f"{save_name}.{job_id}.err").exists():
-        (job_log_dir / f"{save_name}.{job_id}.err").unlink()
-        
-    Path(job_submit_dir / f"slurm.out").symlink_to(job_submit_dir / f"slurm-{job_id}.out")
-    Path(job_submit_dir / f"slurm.err").symlink_to(job_submit_dir / f"slurm-{job_id}.err")
-    Path(job_log_dir / f"{save_name}.{job_id}.out").symlink_to(job_submit_dir / f"slurm-{job_id}.out")
-    Path(job_log_dir / f"{save_name}.{job_id}.err").symlink_to(job_submit_dir / f"slurm-{job_id}.err")
+    from scck.basic.joblog import find_job_stem, find_array_stems, parse_array_spec, record_jobs
+    job_submit_dir = Path(os.getenv('SLURM_SUBMIT_DIR') or os.getcwd()).expanduser()
+
+    # Bulk modes record many jobs at once, e.g. a whole array from its first
+    # task, so that the other tasks do not have to start `scck` at all.
+    if args.array is not None:
+        if args.tasks is not None:
+            stems = [f"{args.array}_{task}" for task in parse_array_spec(args.tasks)]
+        else:
+            stems = find_array_stems(job_submit_dir, args.array)
+        record_jobs(job_submit_dir, stems, get_user_name(), submit_links=False)
+    elif args.jobs:
+        record_jobs(job_submit_dir, args.jobs, get_user_name(), submit_links=False)
+    else:
+        stem = find_job_stem(job_submit_dir)
+        if stem is None:
+            return
+        # Tasks of an array share the submit directory, so only plain jobs
+        # get the `slurm.out` shortcut.
+        record_jobs(job_submit_dir, [stem], get_user_name(), submit_links=not os.getenv('SLURM_ARRAY_TASK_ID'))
+
+def run_job_query(args):
+    import sys
+    from scck.basic.joblog import query_jobs, dump_jobs
+    rows = query_jobs(args.job_ids)
+    if not rows:
+        print(" No such job in the index.", file=sys.stderr)
+        sys.exit(1)
+    if args.out or args.err:
+        for row in rows:
+            print(row["stdout"] if args.out else row["stderr"])
+    else:
+        dump_jobs(rows, args.format)
+
+def run_job_search(args):
+    from scck.fn import get_user_name
+    from scck.basic.joblog import search_jobs, parse_since, dump_jobs
+    rows = search_jobs(
+        user = None if args.all_users else get_user_name(),
+        since = parse_since(args.since) if args.since else None,
+        until = parse_since(args.until) if args.until else None,
+        name = args.name,
+        submit_dir = args.dir,
+        partition = args.partition,
+        limit = args.limit,
+    )
+    dump_jobs(rows, args.format)
+
+def run_job_prune(args):
+    from scck.basic.joblog import prune_jobs, parse_since
+    removed = prune_jobs(before=parse_since(args.older_than) if args.older_than else None, missing=args.missing)
+    print(f" Removed {removed} jobs from the index.")
 
 def run_job_user(args):
     from scck.fn import get_user_name
@@ -117,6 +153,29 @@ def run_job_user(args):
     name = get_user_name()
     print(CFG['Users'][name]['short'][0], end="")
 
+def run_refresh(args):
+    from scck.config.auto import update_user_info
+    config = update_user_info(discover=True, shared=args.shared)
+    if not args.quiet:
+        for name, value in config['Cluster'].items():
+            print(f" {name}: {value['NODES']} nodes, {value['CPUS']} CPUs, {value['GPUS']} GPUs, {value['TIMELIMIT']}")
+
+def run_queue(args):
+    import sys
+    import subprocess
+    from scck.profile import phase
+    from scck.info.syhq import query_jobs, get_owner_resolver, load_owner_cache, aggregate_jobs, dump_aggregate
+    try:
+        jobs = query_jobs(all_users=args.all, accounts=args.account, partitions=args.partition)
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        print(" No SLURM is found.", file=sys.stderr)
+        sys.exit(1)
+
+    with phase("attribution"):
+        rows = aggregate_jobs(jobs, get_owner_resolver(load_owner_cache()))
+    with phase("render"):
+        dump_aggregate(rows, args.format)
+
 def run():
     from argparse import ArgumentParser
     parser = ArgumentParser()
@@ -126,22 +185,76 @@ def run():
                         default=None, 
                         type=str)
     parser.add_argument("-s", "--silent", action="store_true", help="Silent mode.", default=False)
+    parser.add_argument("--profile", action="store_true", help="Report phase timings and child processes at exit.", default=False)
+    parser.add_argument("--profile-output", 
+                        help="Write the profile report as JSON to this file instead of stderr.", 
+                        default="-", 
+                        type=str)
     subparsers = parser.add_subparsers()
     p_cfg = subparsers.add_parser("cfg", help="Get config value from .sccli-kit.")
     p_cfg.add_argument("name", help="Name of the config value", type=str)
     p_cfg.set_defaults(func=run_cfg)
     
+    p_queue = subparsers.add_parser("queue", help="Aggregate nodes per user, partition and state.")
+    p_queue.add_argument("-a", "--all", action="store_true", help="Query the queue of all users.", default=False)
+    p_queue.add_argument("-A", "--account", action="append", help="Query the queue of the account (repeatable).", default=None)
+    p_queue.add_argument("-p", "--partition", action="append", help="Restrict to the partition (repeatable).", default=None)
+    p_queue.add_argument("-f", "--format", choices=["table", "json", "csv"], help="Output format.", default="table")
+    p_queue.set_defaults(func=run_queue)
+    
     p_job = subparsers.add_parser("job", help="Automatic script for job.")
     job_parsers = p_job.add_subparsers()
     p_job_init = job_parsers.add_parser("init", help="Initialize job enviroment.")
+    p_job_init.add_argument("--array", help="Record every task of this array job id.", default=None, type=str)
+    p_job_init.add_argument("--tasks", help="Task ids of --array in sbatch syntax, e.g. 0-99. Default: the tasks with an output file.", default=None, type=str)
+    p_job_init.add_argument("--jobs", help="Record these job ids.", nargs="+", default=None, type=str)
     p_job_init.set_defaults(func=run_job_init)
     p_job_user = job_parsers.add_parser("user", help="Detect user information.")
     p_job_user.set_defaults(func=run_job_user)
+    p_job_query = job_parsers.add_parser("query", help="Show the indexed jobs with these ids.")
+    p_job_query.add_argument("job_ids", help="Job ids; an array job id matches all of its tasks.", nargs="+", type=str)
+    p_job_query.add_argument("--out", action="store_true", help="Only print the stdout paths.", default=False)
+    p_job_query.add_argument("--err", action="store_true", help="Only print the stderr paths.", default=False)
+    p_job_query.add_argument("-f", "--format", choices=["table", "json", "csv"], help="Output format.", default="table")
+    p_job_query.set_defaults(func=run_job_query)
+    p_job_search = job_parsers.add_parser("search", help="Search the indexed jobs, newest first.")
+    p_job_search.add_argument("-s", "--since", help="Started after, e.g. 7d, 12h or 2024-01-31.", default=None, type=str)
+    p_job_search.add_argument("-u", "--until", help="Started before, e.g. 1d or 2024-02-01.", default=None, type=str)
+    p_job_search.add_argument("-n", "--name", help="Glob pattern on the job name.", default=None, type=str)
+    p_job_search.add_argument("-d", "--dir", help="Glob pattern on the submit directory.", default=None, type=str)
+    p_job_search.add_argument("-p", "--partition", help="Partition.", default=None, type=str)
+    p_job_search.add_argument("-a", "--all-users", action="store_true", help="Include the jobs of every user.", default=False)
+    p_job_search.add_argument("-l", "--limit", help="Show at most this many jobs.", default=None, type=int)
+    p_job_search.add_argument("-f", "--format", choices=["table", "json", "csv"], help="Output format.", default="table")
+    p_job_search.set_defaults(func=run_job_search)
+    p_job_prune = job_parsers.add_parser("prune", help="Remove old jobs from the index.")
+    p_job_prune.add_argument("--older-than", help="Remove jobs started before, e.g. 180d or 2024-01-01.", default=None, type=str)
+    p_job_prune.add_argument("--missing", action="store_true", help="Remove jobs whose output file is gone.", default=False)
+    p_job_prune.set_defaults(func=run_job_prune)
+    p_job_sweep = job_parsers.add_parser("sweep", help="Generate (and submit) one job directory per point of a TOML sweep spec.")
+    p_job_sweep.add_argument("spec", help="Path of the sweep spec.", type=str)
+    p_job_sweep.add_argument("-o", "--out", help="Directory to create the jobs in. Default: next to the spec.", default=None, type=str)
+    p_job_sweep.add_argument("-j", "--workers", help="Number of processes writing the directories.", default=None, type=int)
+    p_job_sweep.add_argument("--submit", action="store_true", help="Submit every generated job.", default=False)
+    p_job_sweep.add_argument("--array", action="store_true", help="Generate a single job array over the points.", default=False)
+    p_job_sweep.add_argument("--throttle", help="Max array tasks running at once (sbatch --array=...%%N).", default=None, type=int)
+    p_job_sweep.add_argument("--dry-run", action="store_true", help="Only check the spec and list the directories.", default=False)
+    p_job_sweep.set_defaults(func=lazy_call("scck.basic.sweep:run_sweep"))
+    p_job_ffcache = job_parsers.add_parser("ffcache", help="Print the cache entry of the ppafm force fields of these inputs.")
+    p_job_ffcache.add_argument("inputs", help="Files the force fields are generated from.", nargs="+", type=str)
+    p_job_ffcache.add_argument("--params", help="Path of params.ini.", default="params.ini", type=str)
+    p_job_ffcache.add_argument("--command", action="append", help="Command generating the force fields (repeatable).", default=None, type=str)
+    p_job_ffcache.set_defaults(func=lazy_call("scck.basic.ffcache:run_ffcache"))
     
-    # p_refresh = subparsers.add_parser("refresh", help="Refresh module information.")
-    # p_refresh.set_defaults(func=run_refresh)
+    p_refresh = subparsers.add_parser("refresh", help="Refresh cluster information.")
+    p_refresh.add_argument("-q", "--quiet", action="store_true", help="Do not print the partitions.", default=False)
+    p_refresh.add_argument("--shared", action="store_true", help="Write to the shared cfg.json instead of the per-user one.", default=False)
+    p_refresh.set_defaults(func=run_refresh)
     
     args = parser.parse_args()
+    if args.profile:
+        from scck.profile import enable
+        enable(args.profile_output)
     args.func(args)
     
 if __name__ == "__main__":
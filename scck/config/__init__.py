@@ -1,14 +1,4 @@
-import os
-import json
-from ..const import config_path
-from .auto import update_user_info
+from ..const import config_path, user_config_path
+from .loader import LazyConfig
 
-_name = os.getenv('USER') or os.getenv('LOGNAME')
-
-if not config_path.exists():
-    CFG = update_user_info()
-else:
-    CFG = json.loads(config_path.read_text())
-
-if CFG['Config']['user_mode'] == 'local' and _name is not None and _name not in CFG["Users"]:
-    CFG = update_user_info()
\ No newline at end of file
+CFG = LazyConfig(config_path, user_config_path)
@@ -4,29 +4,65 @@ import re
 import os
 import pwd
 import grp
+import time
 
 from pathlib import Path
-from scck.const import config_path
-
-def update_user_info(*args, **kwargs):
-    if not config_path.exists():
-        config = {
-            "Config": {
-                "user_mode": "local",
-                "job_log_dir": "~/.jobs"
-            },
-            "Users": {},
-            "Cluster": {},
-            "Modules": {}
-        }
-    else:
-        config = json.loads(config_path.read_text())
-        
+from scck.const import config_path, user_config_path
+from scck.profile import phase
+
+# Keys of a `Cluster` partition that `check_slurm_info` discovers.
+PARTITION_KEYS = ("NODES", "CPUS", "GPUS", "QOS", "TIMELIMIT", "SOCKETS", "CORES", "THREADS")
+# Keys of `Config` that describe how fresh the `Cluster` section is.
+CLUSTER_SETTINGS = ("cluster_updated", "cluster_ttl")
+
+def update_user_info(config = None, discover = True, shared = False, *args, **kwargs):
+    """Add the current user (and discovered partitions) to the configuration.
+
+    Changes go to the per-user overlay file, or to the shared cfg.json with
+    `shared`, and nothing is written when nothing changed.
+    """
+    from .loader import default_config, read_config, merge_config, diff_config, write_config
+    base = read_config(config_path) or default_config()
+    if config is None:
+        config = merge_config(base, read_config(user_config_path))
+    before = json.loads(json.dumps(config))
+
     config = check_default_user(config)
-    config = check_slurm_info(config)
-    config_path.write_text(json.dumps(config, indent=4, ensure_ascii=False))
+    if discover:
+        config = check_slurm_info(config)
+
+    changes = diff_config(before, config)
+    if changes:
+        with phase("write"):
+            if shared:
+                write_config(config_path, lambda current: merge_config(current or default_config(), changes))
+            else:
+                # Re-read under the lock so that entries written by other
+                # processes since `config` was loaded are kept.
+                write_config(user_config_path, lambda current: user_overlay(base, merge_config(merge_config(base, current), changes)))
     return config
 
+def user_overlay(base, config):
+    """Return the per-user overlay that turns the shared `base` into `config`.
+
+    Partitions of the shared file are left out unless the user added keys
+    of their own, and so are its refresh time and TTL, so that
+    `refresh --shared` updates are not shadowed by a copy of what the user
+    discovered earlier.
+    """
+    from .loader import diff_config
+    overlay = diff_config(base, config)
+    cluster = overlay.get("Cluster", {})
+    for name in [name for name, value in cluster.items() if name in base.get("Cluster", {})
+                 and value is not None and set(value) <= set(PARTITION_KEYS)]:
+        del cluster[name]
+    settings = overlay.get("Config", {})
+    for key in [key for key in CLUSTER_SETTINGS if key in settings and key in base.get("Config", {})]:
+        del settings[key]
+    for name in [name for name in ("Cluster", "Config") if name in overlay and not overlay[name]]:
+        del overlay[name]
+    return overlay
+
 def check_default_user(config):
     current_user = os.getenv('USER') or os.getenv('LOGNAME')
     
@@ -52,24 +88,23 @@ def check_slurm_info(config):
     user_groups = tuple(grp.getgrgid(gid).gr_name for gid in os.getgroups())
     
     try:
-        lines = subprocess.run(
-            ["sinfo", "-o", "%P %D %c %G %l", "--noheader"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip().splitlines()
-
-        perm = subprocess.run(
-            ["scontrol", "show", "partition"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip().split("PartitionName=")[1:]
-        
-        qos_query = subprocess.run(
-            ["sacctmgr", "show", "qos", "-P", "-n", "format=name,Priority"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip().splitlines()
+        with phase("query"):
+            lines, perm, qos_query = _run_concurrently([
+                ["sinfo", "-o", "%P %D %c %G %l %z", "--noheader"],
+                ["scontrol", "show", "partition"],
+                ["sacctmgr", "show", "qos", "-P", "-n", "format=name,Priority"],
+            ])
+        lines = lines.strip().splitlines()
+        perm = perm.strip().split("PartitionName=")[1:]
+        qos_query = qos_query.strip().splitlines()
         qos_priority = {i.split("|")[0]: float(i.split("|")[1]) for i in qos_query}
 
     except (FileNotFoundError, subprocess.CalledProcessError):
-        partitions = DEBUG_INFO
+        # Keep the partitions found last time and leave them stale, so that
+        # a transient Slurm error is retried instead of saved as fresh.
+        if not config['Cluster']:
+            config['Cluster'].update(DEBUG_INFO)
+        return config
 
     else:
         lines = list(filter(None, map(lambda x: x.strip().replace(
@@ -116,6 +151,12 @@ def check_slurm_info(config):
                     if gpu_match:
                         gpu_count = int(gpu_match.group(1))
 
+                # Parse the node topology, `sockets:cores:threads`
+                topology = {}
+                if len(line) > 5 and re.fullmatch(r'\d+:\d+:\d+', line[5]):
+                    sockets, cores, threads = map(int, line[5].split(":"))
+                    topology = {"SOCKETS": sockets, "CORES": cores, "THREADS": threads}
+
                 # Get QOS for this partition
                 qos = avaliable_partitions[line[0].upper()].get('AllowQos', 'ALL')
 
@@ -130,11 +171,34 @@ def check_slurm_info(config):
                     "CPUS": cpus_per_node,
                     "GPUS": gpu_count,
                     "QOS": qos,
-                    "TIMELIMIT": line[4]  # Default value
+                    "TIMELIMIT": line[4],  # Default value
+                    **topology
                 }
     
+    config['Cluster'].pop("_debug", None)
     for name, value in partitions.items():
-        if name not in config['Cluster']:
-            config['Cluster'][name] = value
+        # Keys added by hand to a partition are kept, discovered ones refreshed.
+        config['Cluster'].setdefault(name, {}).update(value)
+    config['Config']['cluster_updated'] = time.time()
     
-    return config
\ No newline at end of file
+    return config
+
+def _run_concurrently(cmds):
+    # The three scheduler queries are independent, so they run side by side
+    # and the total latency is that of the slowest one.
+    procs = []
+    try:
+        for cmd in cmds:
+            procs.append(subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True))
+        outputs = []
+        for cmd, proc in zip(cmds, procs):
+            stdout, stderr = proc.communicate()
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+            outputs.append(stdout)
+        return outputs
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
\ No newline at end of file
@@ -0,0 +1,212 @@
+import os
+import json
+import marshal
+from pathlib import Path
+from collections.abc import Mapping
+
+from scck.profile import phase
+
+def default_config():
+    return {
+        "Config": {
+            "user_mode": "local",
+            "job_log_dir": "~/.jobs"
+        },
+        "Users": {},
+        "Cluster": {},
+        "Modules": {}
+    }
+
+def is_cluster_stale(config):
+    import time
+    ttl = float(config['Config'].get('cluster_ttl', 86400))
+    return time.time() - float(config['Config'].get('cluster_updated', 0)) > ttl
+
+def get_cache_path():
+    return Path(os.getenv("XDG_CACHE_HOME") or "~/.cache").expanduser() / "scck" / "cfg.marshal"
+
+def refresh_in_background(retry = 600):
+    """Start `scck refresh` detached, at most once every `retry` seconds.
+
+    The time of the last attempt is kept in a lock file next to the cache,
+    so a burst of processes reading a stale config (e.g. the tasks of a job
+    array) starts a single refresh, and a failing one is not retried at once.
+    """
+    import sys
+    import time
+    import fcntl
+    import subprocess
+    lock_path = get_cache_path().with_name("refresh.lock")
+    try:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, "a+") as lock:
+            # Whoever holds the lock is starting the refresh already.
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            lock.seek(0)
+            try:
+                if time.time() - float(lock.read() or 0) < retry:
+                    return
+            except ValueError:
+                pass
+            lock.truncate(0)
+            lock.write(str(time.time()))
+            lock.flush()
+            subprocess.Popen(
+                [sys.executable, "-m", "scck.cli", "refresh", "--quiet"],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True,
+            )
+    except OSError:
+        pass
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (str(path), st.st_mtime_ns, st.st_size)
+
+def read_config(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {}
+
+def merge_config(config, overlay):
+    """Return `config` with every section updated key by key from `overlay`.
+
+    A key set to `None` in the overlay removes it from the section. Neither
+    argument is modified.
+    """
+    merged = json.loads(json.dumps(config))
+    for name, section in overlay.items():
+        merged[name] = {**merged.get(name, {}), **json.loads(json.dumps(section))}
+        for key in [key for key, value in section.items() if value is None]:
+            del merged[name][key]
+    return merged
+
+def diff_config(base, config):
+    """Return the overlay that turns `base` into `config`."""
+    overlay = {}
+    for name, section in config.items():
+        base_section = base.get(name, {})
+        changed = {key: value for key, value in section.items() if base_section.get(key) != value}
+        changed.update({key: None for key in base_section if key not in section})
+        if changed:
+            overlay[name] = changed
+    return overlay
+
+def write_config(path, update):
+    """Apply `update(config)` to the JSON file at `path` under an exclusive lock.
+
+    Readers never see a partial file: the new content is written next to it
+    and moved into place with `os.replace`. The file is left untouched when
+    `update` changes nothing, so concurrent writers of the same entry only
+    pay for the lock.
+    """
+    import fcntl
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f"{path.name}.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        config = read_config(path)
+        new_config = update(json.loads(json.dumps(config)))
+        if new_config == config and path.exists():
+            return config
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}")
+        tmp_path.write_text(json.dumps(new_config, indent=4, ensure_ascii=False))
+        os.replace(tmp_path, path)
+        return new_config
+
+class LazyConfig(Mapping):
+    """Read-only view of cfg.json that only parses the sections it is asked for.
+
+    The shared cfg.json is overlaid with the per-user file at `overlay_path`,
+    which is the only one written to when users or partitions are discovered.
+    Merged sections are kept pre-parsed in a marshal cache that is
+    invalidated by the mtime and size of both files. Slurm discovery only
+    runs when the `Cluster` section is read while still empty, so
+    `scck job ...` never triggers it.
+    """
+    def __init__(self, path: Path, overlay_path: Path = None):
+        self._path = path
+        self._overlay_path = overlay_path
+        self._raw = None
+        self._sections = {}
+
+    def _load_raw(self):
+        stamp = (_stamp(self._path), _stamp(self._overlay_path) if self._overlay_path else None)
+        if stamp == (None, None):
+            return default_config()
+
+        cache_path = get_cache_path()
+        try:
+            with open(cache_path, "rb") as f:
+                cache = marshal.load(f)
+            if cache["stamp"] == stamp:
+                return cache["sections"]
+        except (OSError, EOFError, ValueError, TypeError, KeyError):
+            pass
+
+        if stamp[0] is not None:
+            config = read_config(self._path)
+        else:
+            config = default_config()
+        if stamp[1] is not None:
+            config = merge_config(config, read_config(self._overlay_path))
+        sections = {name: marshal.dumps(value) for name, value in config.items()}
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}")
+            with open(tmp_path, "wb") as f:
+                marshal.dump({"stamp": stamp, "sections": sections}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+        return config
+
+    def _get_raw(self):
+        if self._raw is None:
+            with phase("config load"):
+                self._raw = self._load_raw()
+        return self._raw
+
+    def _parse(self, name):
+        value = self._get_raw()[name]
+        if isinstance(value, bytes):
+            value = marshal.loads(value)
+        self._sections[name] = value
+        return value
+
+    def _update(self, discover):
+        from .auto import update_user_info
+        config = {name: self._sections[name] if name in self._sections else self._parse(name) for name in self._get_raw()}
+        config = update_user_info(config, discover=discover)
+        self._raw = config
+        self._sections = dict(config)
+
+    def __getitem__(self, name):
+        if name in self._sections:
+            return self._sections[name]
+        value = self._parse(name)
+
+        if name == "Users":
+            user = os.getenv('USER') or os.getenv('LOGNAME')
+            if self["Config"]["user_mode"] == "local" and user is not None and user not in value:
+                self._update(discover=False)
+        elif name == "Cluster":
+            if not value:
+                self._update(discover=True)
+            elif is_cluster_stale({"Config": self["Config"]}):
+                # Serve the cached partitions now and refresh them for next time.
+                refresh_in_background()
+        return self._sections[name]
+
+    def __iter__(self):
+        return iter(self._get_raw())
+
+    def __len__(self):
+        return len(self._get_raw())
+
+    def __repr__(self):
+        return repr({name: self[name] for name in self})
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 cmdlen = 48
@@ -13,4 +14,5 @@ title = "\n ".join([
          "Author: Chon-Hei Lo".center(cmdlen, " ")
          ])
 
-config_path = Path(__file__).parent / "config" / "cfg.json"
\ No newline at end of file
+config_path = Path(os.getenv("SCCK_CONFIG") or Path(__file__).parent / "config" / "cfg.json")
+user_config_path = Path(os.getenv("SCCK_USER_CONFIG") or Path(os.getenv("XDG_CONFIG_HOME") or "~/.config").expanduser() / "scck" / "cfg.json")
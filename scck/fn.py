@@ -3,7 +3,6 @@ import os
 from io import StringIO
 from datetime import datetime
 from pathlib import Path
-from typing import Any
 
 from scck.error import BackException
 
@@ -49,7 +48,7 @@ class Prompt:
 
     def select(self,
                title: str, 
-               options: list[str] | dict[Any, str], 
+               options: "list[str] | dict", 
                append_back = True, 
                append_exit = True, 
                default_option = None, 
@@ -86,6 +85,17 @@ class Prompt:
         else:
             raise ValueError(f"Invalid selection: {ans}!")
         
+class BatchPrompt(Prompt):
+    """A `Prompt` that never reads stdin: queued answers are used first, then defaults."""
+    def __init__(self, answers = None, default_str = "@"):
+        super().__init__(prompt = "", default_str = default_str, silent = True)
+        self.future.extend(answers or [])
+
+    def ask(self, inp = None):
+        ans = str(self.future.pop(0)) if self.future else self.ds
+        self.history.append(ans)
+        return ans
+
 def parse_time(s: str):
     formats = [
         "%H",           # 时
@@ -104,6 +114,26 @@ def parse_time(s: str):
 
     raise ValueError(f"Cannot parse time format: {s}")
 
+def parse_seconds(value):
+    """Parse a Slurm duration (`MM`, `MM:SS.sss`, `HH:MM:SS`, `D-HH`, `D-HH:MM:SS`, ...) into seconds."""
+    days, _, clock = str(value).rpartition("-")
+    parts = [float(x) for x in clock.split(":")]
+    if days:
+        # With days the clock starts at hours, otherwise at minutes.
+        parts += [0] * (3 - len(parts))
+    elif len(parts) == 1:
+        parts = [0, parts[0], 0]
+    else:
+        parts = [0] * (3 - len(parts)) + parts
+    hours, minutes, seconds = parts
+    return ((int(days or 0) * 24 + hours) * 60 + minutes) * 60 + seconds
+
+def format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    return f"{days}-{hours:02d}:{minutes:02d}:{seconds:02d}"
+
 def get_user_name():
     from scck.config import CFG
     for name, value in CFG["Users"].items():
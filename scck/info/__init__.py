@@ -1,3 +1,16 @@
-from .syhq import run_slurm_table_generator
-from .dirstat import run_dirstat
-from ..const import config_path
\ No newline at end of file
+from ..const import config_path
+
+_exports = {
+    "run_slurm_table_generator": ".syhq",
+    "run_slurm_table_watch": ".syhq",
+    "run_dirstat": ".dirstat",
+    "run_dirstat_report": ".dirstat_report",
+    "run_dirstat_history": ".dirstat_history",
+}
+
+def __getattr__(name):
+    # Submodules are only imported on first use to keep `scck` startup cheap.
+    if name in _exports:
+        from importlib import import_module
+        return getattr(import_module(_exports[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
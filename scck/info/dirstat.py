@@ -1,25 +1,213 @@
 import os
 import sys
 import multiprocessing as mp
-import subprocess
 from pathlib import Path
 
 from scck.const import cmdlen
+from scck.config import CFG
+from scck.info.dirstat_backend import BACKENDS, PosixBackend, detect_backend
+from scck.info.dirstat_history import append_history
+from scck.profile import phase, profiling, take_commands, add_commands
 
-def _count_files_in_dir(path: Path):
-    try:
-        cmd1 = f'bash -c "lfs find {path} -type f | wc -l"'
-        cmd2 = f'bash -c \'lfs find {path} -type f -print0 | xargs -0 stat -c %b | awk "{{s+=\\$1}} END {{print s*512/1024}}"\''
-        file_count = subprocess.run(cmd1, shell=True, text=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip()
-        total_size = subprocess.run(cmd2, shell=True, text=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.strip()
-    except subprocess.CalledProcessError:
-        file_count = -1
-        total_size = -1
+def _scan_worker(tasks, results, idle, queued, spawned, cancelled, started, index, roots, backend_names, report, reports):
+    # Each worker walks its task depth-first with a private stack. When other
+    # workers are idle and the shared queue cannot feed them, the oldest half
+    # of the stack (the subtrees closest to the root, i.e. the biggest ones)
+    # is handed over to the shared queue for them to steal.
+    import time
+    take_commands()
+    posix = PosixBackend()
+    backends = [BACKENDS[name]() for name in backend_names]
+    while True:
+        with idle.get_lock():
+            idle.value += 1
+        task = tasks.get()
+        with idle.get_lock():
+            idle.value -= 1
+        if task is None:
+            if report is not None or profiling():
+                # `lfs find` and the like run here, so the parent's profile
+                # only sees them through the worker's counts.
+                reports.put((report, take_commands()))
+            break
+        with queued.get_lock():
+            queued.value -= 1
+
+        root, path = task
+        if path == roots[root]:
+            started[root] = time.time()
+        backend = backends[root]
+        if report is not None:
+            report.root = roots[root]
+        is_cancelled = lambda: cancelled[root]
+        file_count = dir_count = blocks = 0
+        updates = {} if index is not None and backend.name == "posix" else None
+        stack = [path]
+        visited = 0
+        last_report = time.monotonic()
+        while stack and not cancelled[root]:
+            visited += 1
+            if visited % 16 == 0:
+                if len(stack) > 1 and queued.value < idle.value:
+                    half = len(stack) // 2
+                    # Count the new tasks before they become visible, so that
+                    # the parent never sees a root as finished while work is
+                    # in flight.
+                    with spawned.get_lock():
+                        spawned[root] += half
+                    with queued.get_lock():
+                        queued.value += half
+                    for subdir in stack[:half]:
+                        tasks.put((root, subdir))
+                    del stack[:half]
+
+                if time.monotonic() - last_report > 0.5:
+                    # Partial counts keep the progress bar moving on big subtrees.
+                    results.put((root, file_count, dir_count, blocks, updates, False))
+                    file_count = dir_count = blocks = 0
+                    updates = {} if updates is not None else None
+                    last_report = time.monotonic()
+
+            current = stack.pop()
+            if current == roots[root] or backend.name == "posix":
+                # Non-POSIX backends scan whole subtrees, so their roots are
+                # first split into one subtree per subdirectory.
+                f, d, b = posix.scan(current, stack, index if updates is not None else None, updates, report=report)
+            else:
+                f, d, b = backend.scan(current, stack, cancelled=is_cancelled, report=report)
+            file_count += f
+            dir_count += d
+            blocks += b
+
+        results.put((root, file_count, dir_count, blocks, updates, True))
+
+def _parallel_count(dirs, workers = None, index = None, new_index = None, backend = "auto", timeout = None, progress = None, report = None):
+    """Yield `(path, file_count, dir_count, size, complete)` for each directory as soon as its whole subtree is scanned.
+
+    When `index` is given, unchanged directories are reused from it and every
+    visited directory is recorded into `new_index`. The `backend` is chosen
+    per directory from its mount point unless forced by name. A directory
+    still running `timeout` seconds after its scan started is abandoned and
+    yielded with its partial counts and `complete` set to False. `progress`
+    is called with the number of newly counted files. Every file seen is
+    also fed to `report` (a `CleanupReport`), which must not be combined
+    with `index` since unchanged directories are not listed.
+    """
+    import time
+    from queue import Empty
+    workers = workers or os.cpu_count() or 1
+    roots = [str(path) for path in dirs]
+    if backend == "auto":
+        backend_names = [detect_backend(path) for path in roots]
     else:
-        file_count = int(file_count)
-        total_size = int(total_size)
-        
-    return path, file_count, total_size
+        backend_names = [backend] * len(roots)
+    tasks = mp.Queue()
+    results = mp.Queue()
+    idle = mp.Value("i", 0)
+    queued = mp.Value("i", len(dirs))
+    spawned = mp.Array("i", len(dirs))
+    cancelled = mp.Array("b", len(dirs), lock=False)
+    started = mp.Array("d", len(dirs), lock=False)
+    reports = mp.Queue()
+
+    # A root is finished when its own task and every task spawned under it
+    # have reported back; only running tasks spawn new ones.
+    received = [0] * len(dirs)
+    finished = [False] * len(dirs)
+    totals = [[0, 0, 0] for _ in dirs]
+    for root, path in enumerate(roots):
+        tasks.put((root, path))
+
+    procs = [mp.Process(target=_scan_worker, args=(tasks, results, idle, queued, spawned, cancelled, started, index, roots, backend_names, report, reports), daemon=True) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+
+    try:
+        remaining = len(dirs)
+        while remaining > 0:
+            if timeout:
+                now = time.time()
+                for root in range(len(dirs)):
+                    if not finished[root] and started[root] > 0 and now - started[root] > timeout:
+                        cancelled[root] = 1
+                        finished[root] = True
+                        remaining -= 1
+                        yield dirs[root], totals[root][0], totals[root][1], totals[root][2] * 512 // 1024, False
+                if remaining == 0:
+                    break
+
+            try:
+                root, file_count, dir_count, blocks, updates, done = results.get(timeout=1 if timeout else None)
+            except Empty:
+                continue
+            if updates is not None and new_index is not None:
+                new_index.update(updates)
+            if finished[root]:
+                continue
+            if progress is not None:
+                progress(file_count)
+            totals[root][0] += file_count
+            totals[root][1] += dir_count
+            totals[root][2] += blocks
+            if not done:
+                continue
+            received[root] += 1
+            with spawned.get_lock():
+                is_finished = received[root] == spawned[root] + 1
+            if is_finished:
+                finished[root] = True
+                remaining -= 1
+                yield dirs[root], totals[root][0], totals[root][1], totals[root][2] * 512 // 1024, True
+    finally:
+        for root in range(len(dirs)):
+            cancelled[root] = 1
+        for proc in procs:
+            tasks.put(None)
+        if report is not None or profiling():
+            # Each worker hands back its own partial report and command
+            # counts when it exits.
+            for proc in procs:
+                try:
+                    worker_report, commands = reports.get(timeout=5)
+                except Empty:
+                    break
+                if report is not None:
+                    report.merge(worker_report)
+                add_commands(commands)
+        for proc in procs:
+            proc.join(timeout=1)
+            if proc.is_alive():
+                proc.terminate()
+
+def _get_index_path():
+    return Path(CFG['Config']['job_log_dir']).expanduser() / ".dirstat" / "index.pickle"
+
+def _load_index():
+    import pickle
+    import time
+    # Files rewritten in place do not touch their directory's mtime, so the
+    # index is dropped for a full rescan once it is older than a few days.
+    max_age = float(CFG['Config'].get('dirstat_full_scan_days', 7)) * 86400
+    try:
+        with open(_get_index_path(), "rb") as f:
+            index = pickle.load(f)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return time.time(), {}
+    if time.time() - index["full_scan"] > max_age:
+        return time.time(), {}
+    return index["full_scan"], index["dirs"]
+
+def _save_index(full_scan, dirs):
+    import pickle
+    index_path = _get_index_path()
+    try:
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"full_scan": full_scan, "dirs": dirs}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        pass
 
 def _fmt_size(size):
     if size == -1:
@@ -31,30 +219,62 @@ def _fmt_size(size):
     else:
         return f"{size / 1024 / 1024:.2f}GB"
 
-def run_dirstat(*args, **kwargs):
-    print(" " + " DIRSTAT ".center(cmdlen, "="))    
+def _fmt_dir(path, complete = True):
+    path = str(path).replace(str(Path.home()), "~")
+    return path if complete else f"{path} (timeout)"
+
+def get_home_dirs():
     blacklist = ("Library",)
     dirs = [d for d in Path.home().glob("*") if d.is_dir() and d.name not in blacklist]
-    dirs = list(filter(lambda x: not x.name.startswith("."), dirs))
+    return list(filter(lambda x: not x.name.startswith("."), dirs))
+
+def run_dirstat(*args, **kwargs):
+    print(" " + " DIRSTAT ".center(cmdlen, "="))    
+    dirs = get_home_dirs()
+
+    from tqdm import tqdm
 
+    with phase("index load"):
+        full_scan, index = _load_index()
+    new_index = {}
     results = []
-    print(" " + "." * len(dirs), end="\r ")
-    with mp.Pool() as pool:
-        results = pool.map(_count_files_in_dir, dirs)
+    with phase("scan"), tqdm(desc=" Scanning", unit=" files", unit_scale=True, leave=False, dynamic_ncols=True) as pbar:
+        for result in _parallel_count(
+            dirs,
+            workers = CFG['Config'].get('dirstat_workers'),
+            index = index,
+            new_index = new_index,
+            backend = CFG['Config'].get('dirstat_backend', 'auto'),
+            timeout = CFG['Config'].get('dirstat_timeout'),
+            progress = pbar.update,
+        ):
+            dir_name, count, ndirs, size, complete = result
+            pbar.write(f" {_fmt_dir(dir_name, complete)}: {count} files, {ndirs} dirs, {_fmt_size(size)}")
+            results.append(result)
+    with phase("write"):
+        _save_index(full_scan, new_index)
+        try:
+            append_history(results)
+        except OSError:
+            pass
     print()
     
-    results = sorted(results, key=lambda x: x[2], reverse=True)
+    with phase("render"):
+        results = sorted(results, key=lambda x: x[3], reverse=True)
     
-    count_max_len = max(len(str(result[1])) for result in results) + 2
-    size_max_len = max(len(str(result[2])) for result in results) + 2
-    dir_max_len = max(max(len(str(result[0]).replace(str(Path.home()), "~")) for result in results) + 1, cmdlen - count_max_len - size_max_len)
-    print(" " + "DIR".center(dir_max_len) + "COUNT".center(count_max_len) + "SIZE".center(size_max_len))
-    print(" " + "-" * (dir_max_len + count_max_len + size_max_len))
-    for dir_name, count, size in results:
-        print(f" {str(dir_name).replace(str(Path.home()), '~'):<{dir_max_len}}{count:>{count_max_len}}{_fmt_size(size):>{size_max_len}}")
-    print(" " + "-" * (dir_max_len + count_max_len + size_max_len))
+        count_max_len = max([len(str(result[1])) for result in results] + [len("COUNT")]) + 2
+        dirs_max_len = max([len(str(result[2])) for result in results] + [len("DIRS")]) + 2
+        size_max_len = max([len(_fmt_size(result[3])) for result in results] + [len("SIZE")]) + 2
+        dir_max_len = max(max(len(_fmt_dir(result[0], result[4])) for result in results) + 1, cmdlen - count_max_len - dirs_max_len - size_max_len)
+        line_len = dir_max_len + count_max_len + dirs_max_len + size_max_len
+        print(" " + "DIR".center(dir_max_len) + "COUNT".center(count_max_len) + "DIRS".center(dirs_max_len) + "SIZE".center(size_max_len))
+        print(" " + "-" * line_len)
+        for dir_name, count, ndirs, size, complete in results:
+            print(f" {_fmt_dir(dir_name, complete):<{dir_max_len}}{count:>{count_max_len}}{ndirs:>{dirs_max_len}}{_fmt_size(size):>{size_max_len}}")
+        print(" " + "-" * line_len)
     
-    total_count = sum(filter(lambda x: x > 0, [result[1] for result in results]))
-    total_size = sum(filter(lambda x: x > 0, [result[2] for result in results]))
-    print(" " + f"{'Total'.ljust(dir_max_len)}{total_count:>{count_max_len}}{_fmt_size(total_size):>{size_max_len}}")
-    sys.exit(0)
\ No newline at end of file
+        total_count = sum(filter(lambda x: x > 0, [result[1] for result in results]))
+        total_dirs = sum(filter(lambda x: x > 0, [result[2] for result in results]))
+        total_size = sum(filter(lambda x: x > 0, [result[3] for result in results]))
+        print(" " + f"{'Total'.ljust(dir_max_len)}{total_count:>{count_max_len}}{total_dirs:>{dirs_max_len}}{_fmt_size(total_size):>{size_max_len}}")
+    sys.exit(0)
@@ -0,0 +1,149 @@
+import os
+import re
+import shutil
+import subprocess
+
+class PosixBackend:
+    """List one directory with `os.scandir`; subdirectories are left to the caller."""
+    name = "posix"
+
+    def scan(self, path: str, stack: list, index: dict = None, updates: dict = None, cancelled = None, report = None):
+        # One `os.scandir` pass yields the file count, directory count and
+        # allocated blocks; `st_blocks` is in 512-byte units. Subdirectories
+        # are pushed onto `stack` for the caller to visit.
+        #
+        # With an `index`, a directory whose mtime is unchanged is not listed
+        # at all: its own entries are taken from the index and only its
+        # recorded subdirectories are visited. Each visited directory is
+        # recorded in `updates` as
+        # (mtime_ns, file_count, dir_count, blocks, subdir_names).
+        if index is not None:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return 0, 0, 0
+            cached = index.get(path)
+            if cached is not None and cached[0] == mtime:
+                updates[path] = cached
+                stack.extend(os.path.join(path, name) for name in cached[4])
+                return cached[1:4]
+
+        file_count = 0
+        dir_count = 0
+        blocks = 0
+        subdirs = []
+        try:
+            it = os.scandir(path)
+        except OSError:
+            return 0, 0, 0
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        dir_count += 1
+                        stack.append(entry.path)
+                        subdirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        file_count += 1
+                        blocks += st.st_blocks
+                        if report is not None:
+                            report.add_file(entry.path, st.st_size, st.st_blocks * 512, st.st_atime, st.st_mtime)
+                except OSError:
+                    continue
+        if index is not None:
+            updates[path] = (mtime, file_count, dir_count, blocks, tuple(subdirs))
+        return file_count, dir_count, blocks
+
+class LustreBackend:
+    """Count a whole subtree with a single `lfs find --printf` call, parsed as it streams."""
+    name = "lustre"
+
+    def scan(self, path: str, stack: list, index: dict = None, updates: dict = None, cancelled = None, report = None):
+        file_count = 0
+        dir_count = 0
+        blocks = 0
+        fmt = "%y %b %s %A@ %T@ %p\\n" if report is not None else "%y %b\\n"
+        try:
+            proc = subprocess.Popen(
+                ["lfs", "find", path, "--printf", fmt],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+            )
+        except OSError:
+            return self._fallback(path, report)
+
+        killed = False
+        with proc:
+            for i, line in enumerate(proc.stdout):
+                if cancelled is not None and i % 4096 == 0 and cancelled():
+                    proc.kill()
+                    killed = True
+                    break
+                kind = line[:1]
+                if kind == b"f":
+                    file_count += 1
+                    if report is None:
+                        blocks += int(line[2:])
+                    else:
+                        _, b, size, atime, mtime, file_path = line.rstrip(b"\n").split(b" ", 5)
+                        blocks += int(b)
+                        report.add_file(os.fsdecode(file_path), int(size), int(b) * 512, float(atime), float(mtime))
+                elif kind == b"d":
+                    dir_count += 1
+
+        if not killed and proc.returncode != 0 and dir_count == 0:
+            # `lfs` without `--printf` support, or not a Lustre path after all.
+            return self._fallback(path, report)
+
+        # `lfs find` prints the starting directory itself, which the caller
+        # has already counted as a subdirectory of its parent.
+        return file_count, max(dir_count - 1, 0), blocks
+
+    def _fallback(self, path: str, report = None):
+        posix = PosixBackend()
+        file_count = dir_count = blocks = 0
+        stack = [path]
+        while stack:
+            f, d, b = posix.scan(stack.pop(), stack, report=report)
+            file_count += f
+            dir_count += d
+            blocks += b
+        return file_count, dir_count, blocks
+
+BACKENDS = {
+    "posix": PosixBackend,
+    "lustre": LustreBackend,
+}
+
+# The kernel escapes these four bytes of mount points as octal; everything
+# else, e.g. UTF-8 names, is written as is.
+_MOUNT_ESCAPES = re.compile(rb"\\(040|011|012|134)")
+
+def _read_mounts():
+    mounts = []
+    try:
+        with open("/proc/mounts", "rb") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 3:
+                    mount_point = _MOUNT_ESCAPES.sub(lambda m: bytes([int(m.group(1), 8)]), fields[1])
+                    mounts.append((os.fsdecode(mount_point), fields[2].decode()))
+    except OSError:
+        pass
+    return mounts
+
+def detect_backend(path, mounts = None):
+    """Return the name of the fastest backend for the filesystem holding `path`."""
+    if mounts is None:
+        mounts = _read_mounts()
+    path = os.path.realpath(path)
+    fs_type = None
+    best = -1
+    for mount_point, mount_type in mounts:
+        if len(mount_point) > best and os.path.commonpath([path, mount_point]) == mount_point:
+            best = len(mount_point)
+            fs_type = mount_type
+
+    if fs_type == "lustre" and shutil.which("lfs") is not None:
+        return "lustre"
+    return "posix"
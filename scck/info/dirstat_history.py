@@ -0,0 +1,119 @@
+import os
+import sys
+import time
+import mmap
+import struct
+from pathlib import Path
+from datetime import datetime
+
+from scck.const import cmdlen
+from scck.config import CFG
+
+# timestamp, path id, file count, dir count, size in KB
+RECORD = struct.Struct("<dIqqq")
+
+def get_history_dir():
+    return Path(CFG['Config']['job_log_dir']).expanduser() / ".dirstat"
+
+def append_history(results, now = None):
+    """Append one snapshot of `(path, file_count, dir_count, size, complete)` results."""
+    import fcntl
+    now = time.time() if now is None else now
+    history_dir = get_history_dir()
+    history_dir.mkdir(parents=True, exist_ok=True)
+
+    # Paths are stored once in a side file; a record refers to its line number.
+    with open(history_dir / "history.paths", "a+") as paths_file:
+        fcntl.flock(paths_file, fcntl.LOCK_EX)
+        paths_file.seek(0)
+        path_ids = {line.rstrip("\n"): i for i, line in enumerate(paths_file)}
+        records = bytearray()
+        for path, file_count, dir_count, size, complete in results:
+            if not complete:
+                continue
+            path = str(path)
+            if path not in path_ids:
+                path_ids[path] = len(path_ids)
+                paths_file.write(path + "\n")
+            records += RECORD.pack(now, path_ids[path], file_count, dir_count, size)
+        paths_file.flush()
+        with open(history_dir / "history.bin", "ab") as f:
+            f.write(records)
+
+def load_history():
+    """Return `(paths, snapshots)` where snapshots maps a timestamp to `{path: (file_count, dir_count, size)}`."""
+    history_dir = get_history_dir()
+    try:
+        paths = (history_dir / "history.paths").read_text().splitlines()
+        f = open(history_dir / "history.bin", "rb")
+    except OSError:
+        return [], {}
+
+    snapshots = {}
+    with f:
+        size = os.fstat(f.fileno()).st_size - os.fstat(f.fileno()).st_size % RECORD.size
+        if size == 0:
+            return paths, snapshots
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+            for stamp, path_id, file_count, dir_count, kbytes in RECORD.iter_unpack(mm):
+                snapshots.setdefault(stamp, {})[paths[path_id]] = (file_count, dir_count, kbytes)
+    return paths, snapshots
+
+def _fmt_delta(size):
+    sign = "+" if size >= 0 else "-"
+    size = abs(size)
+    if size < 1024:
+        return f"{sign}{size:.2f}KB"
+    elif size < 1024 * 1024:
+        return f"{sign}{size / 1024:.2f}MB"
+    else:
+        return f"{sign}{size / 1024 / 1024:.2f}GB"
+
+def run_dirstat_history(p, *args, **kwargs):
+    print(" " + " DIRSTAT HISTORY ".center(cmdlen, "="))
+    _, snapshots = load_history()
+    stamps = sorted(snapshots.keys())
+    if len(stamps) < 2:
+        print(" At least two dirstat runs are needed to compare.")
+        sys.exit(0)
+
+    options = [datetime.fromtimestamp(stamp).strftime("%Y-%m-%d %H:%M:%S") for stamp in stamps]
+    old = p.select(
+        title = " Select the older snapshot:",
+        options = options,
+        default_option = len(stamps) - 2,
+    )
+    new = p.select(
+        title = " Select the newer snapshot:",
+        options = options,
+        default_option = len(stamps) - 1,
+    )
+    old, new = stamps[min(old, new)], stamps[max(old, new)]
+    days = max((new - old) / 86400, 1e-9)
+
+    # A directory missing from one snapshot was new, removed or cut off by
+    # the scan timeout; it is listed apart instead of being compared to zero.
+    rows = []
+    for path in set(snapshots[old]) & set(snapshots[new]):
+        old_count, _, old_size = snapshots[old][path]
+        new_count, _, new_size = snapshots[new][path]
+        rows.append((new_size - old_size, new_count - old_count, path))
+    rows.sort(reverse=True)
+    unmatched = sorted(set(snapshots[old]) ^ set(snapshots[new]))
+
+    home = str(Path.home())
+    print(f" {datetime.fromtimestamp(old):%Y-%m-%d %H:%M} -> {datetime.fromtimestamp(new):%Y-%m-%d %H:%M} ({days:.1f} days)")
+    dir_max_len = max([len(path.replace(home, "~")) for path in [path for _, _, path in rows] + unmatched] + [cmdlen - 36]) + 1
+    print(" " + "DIR".center(dir_max_len) + "FILES".rjust(12) + "SIZE".rjust(12) + "PER DAY".rjust(12))
+    print(" " + "-" * (dir_max_len + 36))
+    for dsize, dcount, path in rows:
+        print(f" {path.replace(home, '~'):<{dir_max_len}}{dcount:>+12}{_fmt_delta(dsize):>12}{_fmt_delta(dsize / days):>12}")
+    print(" " + "-" * (dir_max_len + 36))
+    total_size = sum(row[0] for row in rows)
+    total_count = sum(row[1] for row in rows)
+    print(f" {'Total':<{dir_max_len}}{total_count:>+12}{_fmt_delta(total_size):>12}{_fmt_delta(total_size / days):>12}")
+    if unmatched:
+        print(" " + " Not in both snapshots ".center(dir_max_len + 36, "-"))
+        for path in unmatched:
+            print(f" {path.replace(home, '~'):<{dir_max_len}}{'only older' if path in snapshots[old] else 'only newer':>36}")
+    sys.exit(0)
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import heapq
+from pathlib import Path
+
+from scck.const import cmdlen
+from scck.config import CFG
+
+SIZE_BUCKETS = [
+    ("< 4KB", 4 * 1024),
+    ("< 64KB", 64 * 1024),
+    ("< 1MB", 1024 ** 2),
+    ("< 16MB", 16 * 1024 ** 2),
+    ("< 256MB", 256 * 1024 ** 2),
+    ("< 4GB", 4 * 1024 ** 3),
+    (">= 4GB", float("inf")),
+]
+
+AGE_BUCKETS = [
+    ("< 7 days", 7),
+    ("< 30 days", 30),
+    ("< 90 days", 90),
+    ("< 180 days", 180),
+    ("< 1 year", 365),
+    (">= 1 year", float("inf")),
+]
+
+class CleanupReport:
+    """Bounded summary of every file seen during a dirstat traversal.
+
+    Only the `top_n` largest files and directories are kept, and directory
+    totals are only rolled up for directories at most `depth` levels below
+    a scanned root, so memory does not grow with the number of files.
+    Files are ranked and bucketed by their apparent size; directory totals
+    and the age histograms count the allocated bytes, i.e. the disk space
+    a cleanup would free.
+    """
+    def __init__(self, top_n = 20, depth = 3, now = None):
+        self.top_n = top_n
+        self.depth = depth
+        self.now = time.time() if now is None else now
+        self.root = None
+        self.largest_files = []
+        self.dir_sizes = {}
+        self.size_hist = [[0, 0] for _ in SIZE_BUCKETS]
+        self.mtime_hist = [[0, 0] for _ in AGE_BUCKETS]
+        self.atime_hist = [[0, 0] for _ in AGE_BUCKETS]
+
+    def add_file(self, path: str, size: int, allocated: int, atime: float, mtime: float):
+        if len(self.largest_files) < self.top_n:
+            heapq.heappush(self.largest_files, (size, path))
+        elif size > self.largest_files[0][0]:
+            heapq.heapreplace(self.largest_files, (size, path))
+
+        for i, (_, upper) in enumerate(SIZE_BUCKETS):
+            if size < upper:
+                self.size_hist[i][0] += 1
+                self.size_hist[i][1] += size
+                break
+        for hist, stamp in ((self.mtime_hist, mtime), (self.atime_hist, atime)):
+            age = (self.now - stamp) / 86400
+            for i, (_, upper) in enumerate(AGE_BUCKETS):
+                if age < upper:
+                    hist[i][0] += 1
+                    hist[i][1] += allocated
+                    break
+
+        if self.root is not None:
+            parent = os.path.dirname(path)
+            if parent == self.root:
+                return
+            parts = parent[len(self.root) + 1:].split(os.sep)
+            prefix = self.root
+            for part in parts[:self.depth]:
+                prefix = os.path.join(prefix, part)
+                self.dir_sizes[prefix] = self.dir_sizes.get(prefix, 0) + allocated
+
+    def merge(self, other: "CleanupReport"):
+        for size, path in other.largest_files:
+            if len(self.largest_files) < self.top_n:
+                heapq.heappush(self.largest_files, (size, path))
+            elif size > self.largest_files[0][0]:
+                heapq.heapreplace(self.largest_files, (size, path))
+        for path, size in other.dir_sizes.items():
+            self.dir_sizes[path] = self.dir_sizes.get(path, 0) + size
+        for mine, theirs in ((self.size_hist, other.size_hist), (self.mtime_hist, other.mtime_hist), (self.atime_hist, other.atime_hist)):
+            for a, b in zip(mine, theirs):
+                a[0] += b[0]
+                a[1] += b[1]
+
+    def largest_dirs(self):
+        return heapq.nlargest(self.top_n, ((size, path) for path, size in self.dir_sizes.items()))
+
+def _fmt_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.2f}{unit}"
+        size /= 1024
+    return f"{size:.2f}TB"
+
+def _print_hist(title, buckets, hist):
+    total = sum(b for _, b in hist) or 1
+    print(" " + f" {title} ".center(cmdlen, "-"))
+    for (label, _), (count, size) in zip(buckets, hist):
+        bar = "#" * int(20 * size / total)
+        print(f" {label:<12}{count:>10}{_fmt_bytes(size):>12}  {bar}")
+
+def run_dirstat_report(*args, **kwargs):
+    from tqdm import tqdm
+    from scck.info.dirstat import _parallel_count, _fmt_dir, get_home_dirs
+
+    print(" " + " CLEANUP REPORT ".center(cmdlen, "="))
+    dirs = get_home_dirs()
+    report = CleanupReport(
+        top_n = int(CFG['Config'].get('dirstat_report_top', 20)),
+        depth = int(CFG['Config'].get('dirstat_report_depth', 3)),
+    )
+    # The report needs every file, so the incremental index is not used.
+    with tqdm(desc=" Scanning", unit=" files", unit_scale=True, leave=False, dynamic_ncols=True) as pbar:
+        for dir_name, count, ndirs, size, complete in _parallel_count(
+            dirs,
+            workers = CFG['Config'].get('dirstat_workers'),
+            backend = CFG['Config'].get('dirstat_backend', 'auto'),
+            timeout = CFG['Config'].get('dirstat_timeout'),
+            progress = pbar.update,
+            report = report,
+        ):
+            pbar.write(f" {_fmt_dir(dir_name, complete)}: {count} files")
+
+    home = str(Path.home())
+    print(" " + " Largest files ".center(cmdlen, "-"))
+    for size, path in sorted(report.largest_files, reverse=True):
+        print(f" {_fmt_bytes(size):>10}  {path.replace(home, '~')}")
+    print(" " + " Largest directories ".center(cmdlen, "-"))
+    for size, path in report.largest_dirs():
+        print(f" {_fmt_bytes(size):>10}  {path.replace(home, '~')}")
+    _print_hist("Size", SIZE_BUCKETS, report.size_hist)
+    _print_hist("Last modified", AGE_BUCKETS, report.mtime_hist)
+    _print_hist("Last accessed", AGE_BUCKETS, report.atime_hist)
+    sys.exit(0)
@@ -1,95 +1,279 @@
-import re
 import subprocess
 import os
+import json
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, Counter
 import sys
 
 from scck.const import cmdlen
 from scck.fn import get_str_width
 from scck.config import CFG
+from scck.profile import phase
 
-def is_relative_to(child, parent):
-    child = os.path.realpath(child)
-    parent = os.path.realpath(parent)
-    return os.path.commonpath([child, parent]) == parent
+# Job names and paths may contain commas, so fields are split on the ASCII
+# unit separator instead.
+SQUEUE_SEP = "\x1f"
+# job_id, partition, job_name, state, time, nodes, command, work_dir, user
+SQUEUE_FORMAT = SQUEUE_SEP.join(["%i", "%P", "%j", "%t", "%M", "%D", "%o", "%Z", "%u"])
+
+def query_jobs(all_users=False, accounts=None, partitions=None):
+    cmd = ["squeue", "-o", SQUEUE_FORMAT, "--noheader"]
+    if accounts:
+        cmd += ["-A", ",".join(accounts)]
+    elif not all_users:
+        cmd += ["-u", os.getenv('USER') or os.getenv('LOGNAME') or '']
+    if partitions:
+        cmd += ["-p", ",".join(partitions)]
+
+    with phase("query"):
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+
+    # [[job_id, partition, job_name, state, time, nodes, command, work_dir, user]]
+    return [line.split(SQUEUE_SEP) for line in result.split("\n") if line.strip()]
+
+def get_owner_cache_path():
+    return Path(CFG['Config']['job_log_dir']).expanduser() / ".syhq-owners.json"
+
+def load_owner_cache():
+    try:
+        return json.loads(get_owner_cache_path().read_text())
+    except (OSError, ValueError):
+        return {}
+
+def save_owner_cache(cache, jobs, previous=None):
+    # Job ownership never changes while a job is alive, so only entries of
+    # jobs that left the queue are dropped.
+    alive = set(job[0] for job in jobs)
+    for job_id in [job_id for job_id in cache if job_id not in alive]:
+        del cache[job_id]
+    if cache == previous:
+        return
+    cache_path = get_owner_cache_path()
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}")
+        tmp_path.write_text(json.dumps(cache))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+def get_owner_resolver(cache=None):
+    SHORT_TO_USER = {short: user for user, values in CFG['Users'].items() for short in values['short']}
+    ROOT_TO_USER = {os.path.realpath(Path(values['root']).expanduser()): user for user, values in CFG['Users'].items()}
+
+    def resolve(job):
+        if cache is not None:
+            if job[0] not in cache:
+                cache[job[0]] = _resolve(job)
+            return cache[job[0]]
+        return _resolve(job)
+
+    def _resolve(job):
+        job_prefix = job[2].replace("_", "-").split("-")[0]
+        if job_prefix in SHORT_TO_USER:
+            return SHORT_TO_USER[job_prefix]
+
+        # `squeue` reports the batch script and the submit directory, so the
+        # owner is found without asking slurmctld about every single job.
+        for path in job[6:8]:
+            if not path.startswith("/"):
+                continue
+            path = os.path.realpath(path)
+            for root, user in ROOT_TO_USER.items():
+                if os.path.commonpath([path, root]) == root:
+                    return user
+        return 'Other'
+
+    return resolve
+
+class QueueState:
+    def __init__(self, resolve):
+        self.resolve = resolve
+        self.jobs = {}
+        self.user_stats = defaultdict(lambda: {'PD': 0, 'R': 0, 'CF': 0})
+        self.total_stats = {'PD': 0, 'R': 0, 'CF': 0}
+
+    def _add(self, owner, state, nodes, sign):
+        stats = self.user_stats[owner]
+        if state in self.total_stats:
+            stats[state] += sign * nodes
+            self.total_stats[state] += sign * nodes
+
+    def update(self, jobs):
+        """Apply a new `squeue` snapshot and return the number of changed jobs."""
+        snapshot = {job[0]: job for job in jobs}
+        changed = 0
+        for job_id in list(self.jobs.keys()):
+            if job_id not in snapshot:
+                self._add(*self.jobs.pop(job_id), -1)
+                changed += 1
+
+        for job_id, job in snapshot.items():
+            old = self.jobs.get(job_id)
+            nodes = int(job[5])
+            if old is not None and old[1:] == (job[3], nodes):
+                continue
+            if old is not None:
+                self._add(*old, -1)
+                owner = old[0]
+            else:
+                owner = self.resolve(job)
+            self.jobs[job_id] = (owner, job[3], nodes)
+            self._add(owner, job[3], nodes, 1)
+            changed += 1
+        return changed
+
+    def render(self):
+        user_stats = self.user_stats
+        total_stats = self.total_stats
+        lines = []
+        lines.append(" " + " SLURM JOBS ".center(cmdlen, "="))
+        lines.append(f" Jobs: {len(self.jobs)} ")
+        lines.append("")
+        MAX_USER_WIDTH = max(list(map(lambda x: get_str_width(CFG['Users'][x]['name']), CFG['Users'].keys())) + [0])
+        ELENAME_WIDTH = max(10, (cmdlen - MAX_USER_WIDTH - 2) // 3)
+        lines.append(" " + f"{'User'.center(MAX_USER_WIDTH + 2)}{'Pending'.center(ELENAME_WIDTH)}{'Running'.center(ELENAME_WIDTH)}{'Configuring'.center(ELENAME_WIDTH)}")
+        lines.append(" " + "-" * cmdlen)
+        for user in sorted(CFG['Users'].keys(), key=lambda x: user_stats[x]['R'], reverse=True):
+            stats = user_stats[user]
+            user_show_name = CFG['Users'][user]['name']
+            fmt_width = MAX_USER_WIDTH - get_str_width(user_show_name) + len(user_show_name) + 2
+            lines.append(f" {user_show_name.ljust(fmt_width)}{str(stats['PD']).center(ELENAME_WIDTH)}{str(stats['R']).center(ELENAME_WIDTH)}{str(stats['CF']).center(ELENAME_WIDTH)}")
+
+        if 'Other' in user_stats:
+            lines.append(" " + "-" * cmdlen)
+            lines.append(" " + f"Other".ljust(MAX_USER_WIDTH + 2) + str(user_stats['Other']['PD']).center(ELENAME_WIDTH) + str(user_stats['Other']['R']).center(ELENAME_WIDTH) + str(user_stats['Other']['CF']).center(ELENAME_WIDTH))
+
+        lines.append(" " + "-" * cmdlen)
+        lines.append(" " + f"Total".ljust(MAX_USER_WIDTH + 2) + str(total_stats['PD']).center(ELENAME_WIDTH) + str(total_stats['R']).center(ELENAME_WIDTH) + str(total_stats['CF']).center(ELENAME_WIDTH))
+        return lines
+
+def redraw(old_lines, new_lines, out=sys.stdout):
+    if old_lines is None or len(old_lines) != len(new_lines):
+        if old_lines:
+            # Move to the first row of the previous table and clear below.
+            out.write(f"\x1b[{len(old_lines)}F\x1b[J")
+        out.write("\n".join(new_lines) + "\n")
+    else:
+        for i, (old, new) in enumerate(zip(old_lines, new_lines)):
+            if old != new:
+                up = len(old_lines) - i
+                out.write(f"\x1b[{up}F\x1b[2K{new}\x1b[{up}E")
+    out.flush()
 
 def run_slurm_table_generator(*args, **kwargs):
     try:
-        result = subprocess.run(
-            ["squeue", "-u", os.getenv('USER') or os.getenv('LOGNAME') or '', "-o", "%i,%P,%j,%t,%M,%D", "--noheader"],
-            capture_output=True, text=True, check=True
-        ).stdout.strip()
+        jobs = query_jobs()
     except (FileNotFoundError, subprocess.CalledProcessError):
         print(" No SLURM is found.")
         sys.exit(0)
-    
-    # [[job_id, partition, job_name, state, time, nodes]]
-    if result:
-        jobs = list(map(lambda x: x.split(","), result.split('\n')))
-    else:
-        jobs = []
-    
-    JOBS_CATEGORIES = defaultdict(lambda: list())
-    
-    SHORT_TO_USER = {short: user for user, values in CFG['Users'].items() for short in values['short']}
-    ROOT_TO_USER = {Path(values['root']): user for user, values in CFG['Users'].items()}
-    
+
+    with phase("attribution"):
+        cache = load_owner_cache()
+        previous = dict(cache)
+        state = QueueState(get_owner_resolver(cache))
+        state.update(jobs)
+    with phase("write"):
+        save_owner_cache(cache, jobs, previous)
+
+    with phase("render"):
+        print("\n".join(state.render()))
+    sys.exit(0)
+
+def run_slurm_table_watch(p, *args, **kwargs):
+    import time
+    from shutil import get_terminal_size
+
+    interval = p.fill(
+        title = " Refresh interval in seconds (default: 5)",
+        default = 5,
+        mapper = float,
+        checker = lambda x: x > 0,
+    )
+
+    cache = load_owner_cache()
+    state = QueueState(get_owner_resolver(cache))
+    lines = None
+    failed = False
+    try:
+        while True:
+            try:
+                jobs = query_jobs()
+            except (FileNotFoundError, subprocess.CalledProcessError) as e:
+                if lines is None:
+                    print(" No SLURM is found.")
+                    sys.exit(0)
+                # A busy slurmctld makes single queries time out; keep the
+                # last table and try again on the next tick.
+                error = ((getattr(e, "stderr", None) or str(e)).strip().splitlines() or [""])[0]
+                # `squeue: error: slurm_load_jobs error: Socket timed out ...`
+                error = error.rsplit("error: ", 1)[-1]
+                status = f" {time.strftime('%H:%M:%S')} squeue failed, retrying: {error}"
+                with phase("render"):
+                    # Longer lines would wrap and break the redraw.
+                    new_lines = state.render() + [status[:get_terminal_size().columns - 1]]
+                    redraw(lines, new_lines)
+                lines = new_lines
+                failed = True
+                time.sleep(interval)
+                continue
+
+            previous = dict(cache)
+            with phase("attribution"):
+                changed = state.update(jobs)
+            if changed or failed or lines is None:
+                with phase("render"):
+                    new_lines = state.render()
+                    redraw(lines, new_lines)
+                lines = new_lines
+                failed = False
+                with phase("write"):
+                    save_owner_cache(cache, jobs, previous)
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        sys.exit(0)
+
+def aggregate_jobs(jobs, resolve):
+    """Count jobs and nodes per (user, partition, state) in a single pass."""
+    current_user = os.getenv('USER') or os.getenv('LOGNAME')
+    num_jobs = Counter()
+    num_nodes = Counter()
     for job in jobs:
-        job_prefix = job[2].replace("_", "-").split("-")[0]
-        if job_prefix in SHORT_TO_USER:
-            JOBS_CATEGORIES[SHORT_TO_USER[job_prefix]].append(job)
+        # Jobs of the shared account are split between the configured users,
+        # everybody else is reported under their own Slurm account.
+        if job[8] == current_user:
+            user = resolve(job)
         else:
-            try:
-                sc_result = subprocess.run(
-                    ["scontrol", "show", "job", job[0]],
-                    capture_output=True, text=True, check=True
-                )
-            except subprocess.CalledProcessError:
-                JOBS_CATEGORIES['Other'].append(job)
-            else:
-                match = re.search(r'Command=([^\s]+)', sc_result.stdout)
-                if match:
-                    command_path = Path(match.group(1))
-                    for root, user in ROOT_TO_USER.items():
-                        if is_relative_to(str(command_path), str(root)):
-                            JOBS_CATEGORIES[user].append(job)
-                            break
-                    else:
-                        JOBS_CATEGORIES['Other'].append(job)
-                else:
-                    JOBS_CATEGORIES['Other'].append(job)
-    
-    num_jobs = len(jobs)
-    node_running = sum(map(lambda x: int(x[5]), filter(lambda x: x[3] == "R", jobs)))
-    node_pending = sum(map(lambda x: int(x[5]), filter(lambda x: x[3] == "PD", jobs)))
-    node_configu = sum(map(lambda x: int(x[5]), filter(lambda x: x[3] == "CF", jobs)))
-    
-    user_stats = defaultdict(lambda: {'PD': 0, 'R': 0, 'CF': 0})
-    
-    for user, jobs in JOBS_CATEGORIES.items():
-        user_stats[user]['PD'] = sum(map(lambda x: int(x[5]), filter(lambda x: x[3] == "PD", jobs)))
-        user_stats[user]['R'] = sum(map(lambda x: int(x[5]), filter(lambda x: x[3] == "R", jobs)))
-        user_stats[user]['CF'] = sum(map(lambda x: int(x[5]), filter(lambda x: x[3] == "CF", jobs)))
-    
-    print(" " + " SLURM JOBS ".center(cmdlen, "="))
-    print(f" Jobs: {num_jobs} \n")
-    MAX_USER_WIDTH = max(list(map(lambda x: get_str_width(CFG['Users'][x]['name']), CFG['Users'].keys())) + [0])
-    ELENAME_WIDTH = max(10, (cmdlen - MAX_USER_WIDTH - 2) // 3)
-    print(" " + f"{'User'.center(MAX_USER_WIDTH + 2)}{'Pending'.center(ELENAME_WIDTH)}{'Running'.center(ELENAME_WIDTH)}{'Configuring'.center(ELENAME_WIDTH)}")
-    print(" " + "-" * cmdlen)
-    for user in sorted(CFG['Users'].keys(), key=lambda x: user_stats[x]['R'], reverse=True):
-        stats = user_stats[user]
-        user_show_name = CFG['Users'][user]['name']
-        fmt_width = MAX_USER_WIDTH - get_str_width(user_show_name) + len(user_show_name) + 2
-        print(f" {user_show_name.ljust(fmt_width)}{str(stats['PD']).center(ELENAME_WIDTH)}{str(stats['R']).center(ELENAME_WIDTH)}{str(stats['CF']).center(ELENAME_WIDTH)}")
-        
-    if 'Other' in user_stats:
-        print(" " + "-" * cmdlen)
-        print(" " + f"Other".ljust(MAX_USER_WIDTH + 2) + str(user_stats['Other']['PD']).center(ELENAME_WIDTH) + str(user_stats['Other']['R']).center(ELENAME_WIDTH) + str(user_stats['Other']['CF']).center(ELENAME_WIDTH))
-    
-    print(" " + "-" * cmdlen)
-    print(" " + f"Total".ljust(MAX_USER_WIDTH + 2) + str(node_pending).center(ELENAME_WIDTH) + str(node_running).center(ELENAME_WIDTH) + str(node_configu).center(ELENAME_WIDTH))
+            user = job[8]
+        key = (user, job[1], job[3])
+        num_jobs[key] += 1
+        num_nodes[key] += int(job[5])
 
-    sys.exit(0)
+    rows = []
+    for key in sorted(num_jobs.keys()):
+        user, partition, state = key
+        rows.append({"user": user, "partition": partition, "state": state, "jobs": num_jobs[key], "nodes": num_nodes[key]})
+    return rows
 
+def dump_aggregate(rows, fmt="table", out=sys.stdout):
+    if fmt == "json":
+        json.dump(rows, out, indent=4, ensure_ascii=False)
+        out.write("\n")
+    elif fmt == "csv":
+        import csv
+        writer = csv.DictWriter(out, fieldnames=["user", "partition", "state", "jobs", "nodes"])
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        user_width = max([get_str_width(row["user"]) for row in rows] + [4]) + 2
+        part_width = max([len(row["partition"]) for row in rows] + [9]) + 2
+        width = max(cmdlen, user_width + part_width + 24)
+        out.write(" " + " SLURM QUEUE ".center(width, "=") + "\n")
+        out.write(" " + f"{'User'.ljust(user_width)}{'Partition'.ljust(part_width)}{'State'.center(8)}{'Jobs'.rjust(8)}{'Nodes'.rjust(8)}" + "\n")
+        out.write(" " + "-" * width + "\n")
+        for row in rows:
+            fmt_width = user_width - get_str_width(row["user"]) + len(row["user"])
+            out.write(" " + f"{row['user'].ljust(fmt_width)}{row['partition'].ljust(part_width)}{row['state'].center(8)}{row['jobs']:>8}{row['nodes']:>8}" + "\n")
+        out.write(" " + "-" * width + "\n")
+        out.write(" " + f"{'Total'.ljust(user_width + part_width + 8)}{sum(row['jobs'] for row in rows):>8}{sum(row['nodes'] for row in rows):>8}" + "\n")
+    out.flush()
@@ -0,0 +1,154 @@
+import sys
+import time
+from contextlib import contextmanager
+
+from scck.const import cmdlen
+
+_profiler = None
+
+class Profiler:
+    """Collect per-phase wall times and per-command child process statistics.
+
+    Every `subprocess.Popen` (and so every `subprocess.run`) started after
+    `install()` is timed from start until its exit is observed, and
+    `multiprocessing` workers are counted.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.phases = {}
+        self.commands = {}
+        self.workers = 0
+
+    def install(self):
+        import subprocess
+        profiler = self
+
+        class ProfiledPopen(subprocess.Popen):
+            def __init__(self, args, *pargs, **kwargs):
+                self._profile_start = time.perf_counter()
+                self._profile_done = False
+                cmd = args if isinstance(args, str) else args[0]
+                self._profile_name = str(cmd).split()[0].rsplit("/", 1)[-1]
+                super().__init__(args, *pargs, **kwargs)
+
+            def _profile_record(self):
+                if not self._profile_done and self.returncode is not None:
+                    self._profile_done = True
+                    stats = profiler.commands.setdefault(self._profile_name, {"count": 0, "wait_s": 0.0})
+                    stats["count"] += 1
+                    stats["wait_s"] += time.perf_counter() - self._profile_start
+
+            def wait(self, *args, **kwargs):
+                try:
+                    return super().wait(*args, **kwargs)
+                finally:
+                    self._profile_record()
+
+            def poll(self):
+                try:
+                    return super().poll()
+                finally:
+                    self._profile_record()
+
+        subprocess.Popen = ProfiledPopen
+
+        try:
+            import multiprocessing.process
+        except ImportError:
+            return
+        start = multiprocessing.process.BaseProcess.start
+
+        def counted_start(process):
+            profiler.workers += 1
+            return start(process)
+
+        multiprocessing.process.BaseProcess.start = counted_start
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, {"count": 0, "wall_s": 0.0})
+            stats["count"] += 1
+            stats["wall_s"] += time.perf_counter() - start
+
+    def report(self):
+        import resource
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return {
+            "wall_s": time.perf_counter() - self.start,
+            "python_cpu_s": time.process_time() - self.cpu_start,
+            "children_cpu_s": children.ru_utime + children.ru_stime,
+            "child_processes": sum(stats["count"] for stats in self.commands.values()) + self.workers,
+            "multiprocessing_workers": self.workers,
+            "commands": self.commands,
+            "phases": self.phases,
+        }
+
+    def dump(self, target = "-"):
+        report = self.report()
+        if target != "-":
+            import json
+            with open(target, "w") as f:
+                json.dump(report, f, indent=4)
+            return
+
+        out = sys.stderr
+        print(" " + " PROFILE ".center(cmdlen, "="), file=out)
+        print(f" Wall time:        {report['wall_s']:>10.3f}s", file=out)
+        print(f" Python CPU time:  {report['python_cpu_s']:>10.3f}s", file=out)
+        print(f" Children CPU:     {report['children_cpu_s']:>10.3f}s", file=out)
+        print(f" Child processes:  {report['child_processes']:>10d}", file=out)
+        if report["phases"]:
+            print(" " + " Phases ".center(cmdlen, "-"), file=out)
+            for name, stats in report["phases"].items():
+                print(f" {name:<18}{stats['wall_s']:>10.3f}s{stats['count']:>8}x", file=out)
+        if report["commands"]:
+            print(" " + " External commands ".center(cmdlen, "-"), file=out)
+            for name, stats in sorted(report["commands"].items(), key=lambda x: x[1]["wait_s"], reverse=True):
+                print(f" {name:<18}{stats['wait_s']:>10.3f}s{stats['count']:>8}x", file=out)
+
+def enable(target = "-"):
+    """Start profiling the current process and report at exit to `target` ("-" for stderr)."""
+    import atexit
+    global _profiler
+    _profiler = Profiler()
+    _profiler.install()
+    atexit.register(_profiler.dump, target)
+    return _profiler
+
+def phase(name):
+    """Time the enclosed block as `name` when profiling is enabled."""
+    if _profiler is None:
+        return _null_phase()
+    return _profiler.phase(name)
+
+def take_commands():
+    """Return and reset the external commands counted in this process.
+
+    Forked workers call it once on start, to drop the counts inherited from
+    the parent, and again on exit to hand theirs back to `add_commands`.
+    """
+    if _profiler is None:
+        return {}
+    commands, _profiler.commands = _profiler.commands, {}
+    return commands
+
+def add_commands(commands):
+    """Add the counts returned by `take_commands` in a worker to this process."""
+    if _profiler is None:
+        return
+    for name, stats in commands.items():
+        total = _profiler.commands.setdefault(name, {"count": 0, "wait_s": 0.0})
+        total["count"] += stats["count"]
+        total["wait_s"] += stats["wait_s"]
+
+def profiling():
+    return _profiler is not None
+
+@contextmanager
+def _null_phase():
+    yield